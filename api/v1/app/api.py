@@ -34,6 +34,7 @@ def get_data(
     osm_type: str,
     osm_subtype: List[str] | None = Query(None),
     bbox: List[str] | None = Query(None),
+    bbox_only: bool = False,
     epsg_code: int = 4326,
     geom_type: str | None = None,
     climate_variable: str | None = None,
@@ -101,7 +102,11 @@ def get_data(
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
-    query, query_params = GetDataQueryBuilder(input_params).build_query()
+    # bbox_only trades exact intersection for a bounding box overlap check.
+    # Fine for map display, where a feature just outside a bbox is harmless.
+    query, query_params = GetDataQueryBuilder(
+        input_params, bbox_only=bbox_only
+    ).build_query()
 
     result = database.execute_query(query=query, params=query_params)
     result = result[0][0]
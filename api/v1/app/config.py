@@ -8,6 +8,8 @@ OSM_AVAILABLE_CATEGORIES = {
 OSM_SCHEMA_NAME = "osm"
 OSM_TABLE_TAGS = "tags"
 OSM_COLUMN_GEOM = "geom"
+OSM_COLUMN_GEOM_SRID = 4326  # SRID the pgosm-flex import was run with
+OSM_COLUMN_BBOX = "bbox"  # ST_Envelope(geom), stored and GiST indexed on each category view
 OSM_TABLE_PLACES = "place_polygon"  # This table contains Administrative Boundary data (cities, counties, towns, etc...)
 OSM_TABLE_PLACES_ADMIN_LEVELS = {"county": 6, "city": 8}
 
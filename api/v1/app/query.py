@@ -2,6 +2,9 @@
 This module houses code relating to building SQL queries
 """
 
+import struct
+from functools import cached_property, lru_cache
+
 from psycopg2 import sql
 
 from typing import List, Dict, Tuple, Optional, Any
@@ -10,21 +13,81 @@ from . import config
 
 from .schemas import GetDataInputParameters
 
+# SQL fragments that don't depend on the request, built once at import and
+# shared by every query rather than rebuilt per clause
+_SPACE = sql.SQL(" ")
+_COMMA = sql.SQL(", ")
+_OSM_SCHEMA = sql.Identifier(config.OSM_SCHEMA_NAME)
+_CLIMATE_SCHEMA = sql.Identifier(config.CLIMATE_SCHEMA_NAME)
+_TAGS_TABLE = sql.Identifier(config.OSM_TABLE_TAGS)
+_PLACES_TABLE = sql.Identifier(config.OSM_TABLE_PLACES)
+_GEOM_COLUMN = sql.Identifier(config.OSM_COLUMN_GEOM)
+_CLIMATE_ALIAS = sql.Identifier(config.CLIMATE_TABLE_ALIAS)
+
+_TAGS_FIELD = sql.SQL("{schema}.{table}.{column} AS osm_tags").format(
+    schema=_OSM_SCHEMA, table=_TAGS_TABLE, column=sql.Identifier("tags")
+)
+_ADMIN_FIELDS = tuple(
+    sql.SQL("{alias}.name AS {admin}").format(
+        alias=sql.Identifier(admin), admin=sql.SQL(admin)
+    )
+    for admin in ("county", "city")
+)
+_CLIMATE_FIELDS = tuple(
+    sql.SQL("{alias}.{column}").format(alias=_CLIMATE_ALIAS, column=sql.SQL(column))
+    for column in (
+        "ssp",
+        "month",
+        "decade",
+        "ensemble_mean",
+        "ensemble_median",
+        "ensemble_stddev",
+        "ensemble_min",
+        "ensemble_max",
+        "ensemble_q1",
+        "ensemble_q3",
+    )
+)
+_CLIMATE_JOIN_SELECT = sql.SQL(
+    "INNER JOIN ("
+    "SELECT s.osm_id, s.ssp, s.month, s.decade, s.value_mean AS ensemble_mean, s.value_median AS ensemble_median, s.value_stddev AS ensemble_stddev, s.value_min AS ensemble_min, s.value_max AS ensemble_max, s.value_q1 AS ensemble_q1, s.value_q3 AS ensemble_q3 "
+)
+# Decades and months are bound as arrays, like the osm type filters, so the
+# statement text doesn't depend on how many are requested
+_CLIMATE_JOIN_FILTER = sql.SQL(
+    "WHERE s.ssp = %s AND s.decade = ANY(%s) AND s.month = ANY(%s)) AS {alias} "
+).format(alias=_CLIMATE_ALIAS)
+
 
 class GetDataQueryBuilder:
     """Creates query for PG OSM Flex Database
 
     The query will return data in a GeoJSON format
+
+    Each clause is built on first access and cached for the life of the
+    builder, since it depends only on the input params.
     """
 
-    def __init__(self, input_params: GetDataInputParameters) -> None:
+    # Bbox features with more vertices than this are split with ST_Subdivide,
+    # so each piece gets its own tight index lookup
+    _bbox_subdivide_max_vertices = 64
+
+    def __init__(
+        self, input_params: GetDataInputParameters, bbox_only: bool = False
+    ) -> None:
 
         self.input_params = input_params
 
+        # Filter on bounding boxes alone (index-only &&) instead of exact
+        # intersection with the bbox geometry. Cheaper, but can return features
+        # that only come near a non-rectangular bbox.
+        self.bbox_only = bbox_only
+
         # Primary table will be a materialized view of the given category
         self.primary_table = self.input_params.osm_category
 
-    def _create_select_statement(self) -> Tuple[sql.SQL, List[Any]]:
+    @cached_property
+    def _select_statement(self) -> Tuple[sql.SQL, List[Any]]:
         """Bulids a dynamic SQL SELECT statement for the get_osm_data method
 
         NOTE, we use ST_Centroid() to get lat/lon values for non-point shapes.
@@ -37,40 +100,23 @@ class GetDataQueryBuilder:
         """
         params = list()
 
+        table = sql.Identifier(self.primary_table)
+        geom = sql.SQL(".").join([_OSM_SCHEMA, table, _GEOM_COLUMN])
+
         # Initial list of fields that are always returned
         select_fields = [
-            sql.Identifier(config.OSM_SCHEMA_NAME, self.primary_table, "osm_id"),
-            sql.Identifier(config.OSM_SCHEMA_NAME, self.primary_table, "osm_type"),
-            sql.SQL("{schema}.{table}.{column} AS osm_tags").format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                table=sql.Identifier(config.OSM_TABLE_TAGS),
-                column=sql.Identifier("tags"),
+            sql.SQL(".").join([_OSM_SCHEMA, table, sql.Identifier("osm_id")]),
+            sql.SQL(".").join([_OSM_SCHEMA, table, sql.Identifier("osm_type")]),
+            _TAGS_FIELD,
+            sql.SQL("ST_Transform({geom}, %s) AS geometry").format(geom=geom),
+            sql.SQL("ST_AsText(ST_Transform({geom}, %s), 3) AS geometry_wkt").format(
+                geom=geom
             ),
-            sql.SQL("ST_Transform({schema}.{table}.{column}, %s) AS geometry").format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                table=sql.Identifier(self.primary_table),
-                column=sql.Identifier(config.OSM_COLUMN_GEOM),
+            sql.SQL("ST_X(ST_Centroid(ST_Transform({geom}, %s))) AS longitude").format(
+                geom=geom
             ),
-            sql.SQL(
-                "ST_AsText(ST_Transform({schema}.{table}.{column}, %s), 3) AS geometry_wkt"
-            ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                table=sql.Identifier(self.primary_table),
-                column=sql.Identifier(config.OSM_COLUMN_GEOM),
-            ),
-            sql.SQL(
-                "ST_X(ST_Centroid(ST_Transform({schema}.{table}.{column}, %s))) AS longitude"
-            ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                table=sql.Identifier(self.primary_table),
-                column=sql.Identifier(config.OSM_COLUMN_GEOM),
-            ),
-            sql.SQL(
-                "ST_Y(ST_Centroid(ST_Transform({schema}.{table}.{column}, %s))) AS latitude"
-            ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                table=sql.Identifier(self.primary_table),
-                column=sql.Identifier(config.OSM_COLUMN_GEOM),
+            sql.SQL("ST_Y(ST_Centroid(ST_Transform({geom}, %s))) AS latitude").format(
+                geom=geom
             ),
         ]
         params.extend([self.input_params.epsg_code] * 4)
@@ -78,25 +124,11 @@ class GetDataQueryBuilder:
         # Add extra where clause for subtypes if they are specified
         if self.input_params.osm_subtypes:
             select_fields.append(
-                sql.Identifier(
-                    config.OSM_SCHEMA_NAME, self.primary_table, "osm_subtype"
-                )
+                sql.SQL(".").join([_OSM_SCHEMA, table, sql.Identifier("osm_subtype")])
             )
 
-        # County and City tables are aliased in the _create_join_method()
-        conditions = self._create_admin_table_conditions("county")
-        county_field = sql.SQL("{admin_table_alias}.name AS county").format(
-            schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-            admin_table_alias=sql.Identifier(conditions["alias"]),
-        )
-        select_fields.append(county_field)
-
-        conditions = self._create_admin_table_conditions("city")
-        city_field = sql.SQL("{admin_table_alias}.name AS city").format(
-            schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-            admin_table_alias=sql.Identifier(conditions["alias"]),
-        )
-        select_fields.append(city_field)
+        # County and City tables are aliased in _join_statement
+        select_fields.extend(_ADMIN_FIELDS)
 
         if (
             self.input_params.climate_variable
@@ -104,83 +136,24 @@ class GetDataQueryBuilder:
             and self.input_params.climate_month
             and self.input_params.climate_decade
         ):
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ssp").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.month").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.decade").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_mean").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_median").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_stddev").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_min").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_max").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_q1").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
-            select_fields.append(
-                sql.SQL("{climate_table_alias}.ensemble_q3").format(
-                    climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
-                    climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
-                )
-            )
+            select_fields.extend(_CLIMATE_FIELDS)
 
         select_statement = sql.SQL("SELECT {columns}").format(
-            columns=sql.SQL(", ").join(select_fields)
+            columns=_COMMA.join(select_fields)
         )
-        self.select_statement = select_statement
         return select_statement, params
 
-    def _create_from_statement(self) -> sql.SQL:
+    @cached_property
+    def _from_statement(self) -> sql.SQL:
 
         from_statement = sql.SQL("FROM {schema}.{table}").format(
-            schema=sql.Identifier(config.OSM_SCHEMA_NAME),
+            schema=_OSM_SCHEMA,
             table=sql.Identifier(self.primary_table),
         )
         return from_statement
 
-    def _create_join_statement(self) -> Tuple[sql.SQL, List[Any]]:
+    @cached_property
+    def _join_statement(self) -> Tuple[sql.SQL, List[Any]]:
         """Builds SQL Join statement
 
         Returns:
@@ -188,12 +161,14 @@ class GetDataQueryBuilder:
         """
         params = list()
 
+        table = sql.Identifier(self.primary_table)
+
         # the tags table contains all of the properties of the features
         join_statement = sql.SQL(
             "JOIN {schema}.{tags_table} ON {schema}.{primary_table}.osm_id = {schema}.{tags_table}.osm_id"
         ).format(
-            schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-            tags_table=sql.Identifier(config.OSM_TABLE_TAGS),
+            schema=_OSM_SCHEMA,
+            tags_table=_TAGS_TABLE,
             primary_table=sql.SQL(self.primary_table),
         )
 
@@ -209,14 +184,14 @@ class GetDataQueryBuilder:
                 "ON ST_Intersects({schema}.{primary_table}.{geom_column}, {alias}.{geom_column}) "
                 "AND {alias}.admin_level = %s "
             ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                admin_table=sql.Identifier(config.OSM_TABLE_PLACES),
-                primary_table=sql.Identifier(self.primary_table),
-                geom_column=sql.Identifier(config.OSM_COLUMN_GEOM),
+                schema=_OSM_SCHEMA,
+                admin_table=_PLACES_TABLE,
+                primary_table=table,
+                geom_column=_GEOM_COLUMN,
                 alias=sql.Identifier(admin["alias"]),
             )
             params.append(admin["level"])
-            join_statement = sql.SQL(" ").join([join_statement, admin_join])
+            join_statement = _SPACE.join([join_statement, admin_join])
 
         if (
             self.input_params.climate_variable
@@ -231,99 +206,84 @@ class GetDataQueryBuilder:
             )
             climate_join = sql.Composed(
                 [
-                    sql.SQL("INNER JOIN ("),
-                    sql.SQL(
-                        "SELECT s.osm_id, s.ssp, s.month, s.decade, s.value_mean AS ensemble_mean, s.value_median AS ensemble_median, s.value_stddev AS ensemble_stddev, s.value_min AS ensemble_min, s.value_max AS ensemble_max, s.value_q1 AS ensemble_q1, s.value_q3 AS ensemble_q3 "
-                    ),
+                    _CLIMATE_JOIN_SELECT,
                     sql.SQL("FROM {climate_schema}.{climate_table} s ").format(
-                        climate_schema=sql.Identifier(config.CLIMATE_SCHEMA_NAME),
+                        climate_schema=_CLIMATE_SCHEMA,
                         climate_table=sql.Identifier(climate_table),
                     ),
-                    sql.SQL("WHERE s.ssp = %s AND s.decade IN %s AND s.month IN %s"),
-                    sql.SQL(") AS {climate_table_alias} ").format(
-                        climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS)
-                    ),
+                    _CLIMATE_JOIN_FILTER,
                     sql.SQL(
                         "ON {schema}.{primary_table}.osm_id = {climate_table_alias}.osm_id"
                     ).format(
-                        schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                        primary_table=sql.Identifier(self.primary_table),
-                        climate_table_alias=sql.Identifier(config.CLIMATE_TABLE_ALIAS),
+                        schema=_OSM_SCHEMA,
+                        primary_table=table,
+                        climate_table_alias=_CLIMATE_ALIAS,
                     ),
                 ]
             )
             params += [
                 self.input_params.climate_ssp,
-                tuple(set(self.input_params.climate_decade)),
-                tuple(set(self.input_params.climate_month)),
+                sorted(set(self.input_params.climate_decade)),
+                sorted(set(self.input_params.climate_month)),
             ]
 
-            join_statement = sql.SQL(" ").join([join_statement, climate_join])
+            join_statement = _SPACE.join([join_statement, climate_join])
 
-        self.join_statement = join_statement
         return join_statement, params
 
-    def _create_where_clause(self) -> Tuple[sql.SQL, List[Any]]:
-        params = list()
-        # Always filter by osm type to throttle data output!
-        where_clause = sql.SQL("WHERE {schema}.{primary_table}.{column} IN %s").format(
-            schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-            primary_table=sql.Identifier(self.primary_table),
-            column=sql.Identifier("osm_type"),
+    @cached_property
+    def _where_clause(self) -> Tuple[sql.SQL, Tuple[Any, ...]]:
+        where_clause = _build_where_template(
+            primary_table=self.primary_table,
+            has_subtypes=bool(self.input_params.osm_subtypes),
+            has_geom_type=bool(self.input_params.geom_type),
+            n_bbox_rectangles=len(self._bbox_features[0]),
+            n_bbox_envelopes=len(self._bbox_features[1]),
+            n_bbox_subdivided=len(self._bbox_features[2]),
+            bbox_only=self.bbox_only,
         )
-        params.append(tuple(self.input_params.osm_types))
 
-        if self.input_params.osm_subtypes:
-            subtype_clause = sql.SQL(
-                "AND {schema}.{primary_table}.{column} IN %s"
-            ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                primary_table=sql.Identifier(self.primary_table),
-                column=sql.Identifier("osm_subtype"),
-            )
-            params.append(tuple(self.input_params.osm_subtypes))
-            where_clause = sql.SQL(" ").join([where_clause, subtype_clause])
-
-        if self.input_params.geom_type:
-            geom_type_clause = sql.SQL(
-                "AND {schema}.{primary_table}.geom_type = %s"
-            ).format(
-                schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                primary_table=sql.Identifier(self.primary_table),
-            )
-            params.append("ST_" + self.input_params.geom_type)
-            where_clause = sql.SQL(" ").join([where_clause, geom_type_clause])
+        # Built in one pass, in the order of the template's placeholders
+        params = (
+            self.input_params.osm_types,
+            *(
+                (self.input_params.osm_subtypes,)
+                if self.input_params.osm_subtypes
+                else ()
+            ),
+            *(
+                ("ST_" + self.input_params.geom_type,)
+                if self.input_params.geom_type
+                else ()
+            ),
+            *self._bbox_params(),
+        )
 
-        # If a bounding box GeoJSON is passed in, use as filter
-        if self.input_params.bbox:
-            bbox_filter = sql.SQL("AND (")
-            count = 0
-            # Handles multiple bounding boxes drawn by user
-            for feature in self.input_params.bbox.features:
-                if count == 0:
-                    pass
-                else:
-                    conditional = sql.SQL("OR")
-                    bbox_filter = sql.SQL(" ").join([bbox_filter, conditional])
-                feature_filter = sql.SQL(
-                    "ST_Intersects(ST_Transform({schema}.{primary_table}.{geom_column}, %s), ST_GeomFromText(%s, %s))"
-                ).format(
-                    schema=sql.Identifier(config.OSM_SCHEMA_NAME),
-                    primary_table=sql.Identifier(self.primary_table),
-                    geom_column=sql.Identifier(config.OSM_COLUMN_GEOM),
-                )
-                params.append(self.input_params.epsg_code)
-                params.append(feature.geometry.wkt)
-                params.append(self.input_params.epsg_code)
-                bbox_filter = sql.SQL(" ").join([bbox_filter, feature_filter])
-                count += 1
-            bbox_filter = sql.SQL(" ").join([bbox_filter, sql.SQL(")")])
-
-            where_clause = sql.SQL(" ").join([where_clause, bbox_filter])
-
-        self.where_clause = where_clause
         return where_clause, params
 
+    def _bbox_params(self) -> Tuple[Any, ...]:
+        """Params for the bbox filters, in the template's order"""
+        rectangles, envelope_geometries, subdivided_geometries = self._bbox_features
+        epsg_code = self.input_params.epsg_code
+
+        params = [p for rectangle in rectangles for p in rectangle]
+        params += [_to_ewkb(geometry, epsg_code) for geometry in envelope_geometries]
+        if envelope_geometries and not self.bbox_only:
+            # The exact intersection runs once, against all of the bboxes
+            if len(envelope_geometries) == 1:
+                collected = _to_ewkb(envelope_geometries[0], epsg_code)
+            else:
+                collected = _collect_ewkb(envelope_geometries, epsg_code)
+            params += [epsg_code, collected]
+        for geometry in subdivided_geometries:
+            ewkb = _to_ewkb(geometry, epsg_code)
+            params += [ewkb, self._bbox_subdivide_max_vertices]
+            if not self.bbox_only:
+                # Matching a piece's envelope is not an intersection, so rows
+                # are rechecked against the whole polygon
+                params.append(ewkb)
+        return tuple(params)
+
     def _create_limit(self) -> Tuple[sql.SQL, List[Any]]:
         """Adds limit to reduce size of output, for debugging and throttling
 
@@ -348,6 +308,53 @@ class GetDataQueryBuilder:
 
         return admin_conditions
 
+    @cached_property
+    def _bbox_features(
+        self,
+    ) -> Tuple[Tuple[Tuple[float, ...], ...], Tuple[Any, ...], Tuple[Any, ...]]:
+        """The bbox features, split by how they are filtered
+
+        Returns the ST_MakeEnvelope params of axis-aligned rectangles, then the
+        geometries of other polygons filtered by their envelope, then those
+        large enough to subdivide.
+        """
+        rectangles, envelope_geometries, subdivided_geometries = [], [], []
+        if self.input_params.bbox:
+            for feature in self.input_params.bbox.features:
+                envelope_params = self._bbox_to_envelope_params(feature.geometry)
+                if envelope_params:
+                    rectangles.append(envelope_params)
+                elif (
+                    _count_vertices(feature.geometry)
+                    > self._bbox_subdivide_max_vertices
+                ):
+                    subdivided_geometries.append(feature.geometry)
+                else:
+                    envelope_geometries.append(feature.geometry)
+        return (
+            tuple(rectangles),
+            tuple(envelope_geometries),
+            tuple(subdivided_geometries),
+        )
+
+    def _bbox_to_envelope_params(self, geometry) -> Optional[Tuple[float, ...]]:
+        """Returns (xmin, ymin, xmax, ymax, srid) if geometry is an axis-aligned
+        rectangle, as drawn by the map's box tool, else None
+        """
+        if geometry.type != "Polygon" or len(geometry.coordinates) != 1:
+            return None
+        ring = [tuple(position[:2]) for position in geometry.coordinates[0]]
+        if len(ring) != 5 or ring[0] != ring[-1] or len(set(ring[:4])) != 4:
+            return None
+        # Every edge is either vertical or horizontal
+        if any(
+            (x0 != x1) == (y0 != y1) for (x0, y0), (x1, y1) in zip(ring, ring[1:])
+        ):
+            return None
+        xs = [x for x, _ in ring]
+        ys = [y for _, y in ring]
+        return (min(xs), min(ys), max(xs), max(ys), self.input_params.epsg_code)
+
     def build_query(self) -> Tuple[sql.Composable, List[Any]]:
         """
         Builds SQL query based on user input
@@ -369,15 +376,15 @@ class GetDataQueryBuilder:
         """
         )
 
-        select_statement, params = self._create_select_statement()
+        select_statement, params = self._select_statement
         self.query_params.extend(params)
 
-        from_statement = self._create_from_statement()
+        from_statement = self._from_statement
 
-        join_statement, params = self._create_join_statement()
+        join_statement, params = self._join_statement
         self.query_params.extend(params)
 
-        where_clause, params = self._create_where_clause()
+        where_clause, params = self._where_clause
         self.query_params.extend(params)
 
         limit_statement, params = self._create_limit()
@@ -398,3 +405,201 @@ class GetDataQueryBuilder:
         self.query_params = tuple(self.query_params)
 
         return self.query, self.query_params
+
+
+@lru_cache(maxsize=64)
+def _build_where_template(
+    primary_table: str,
+    has_subtypes: bool,
+    has_geom_type: bool,
+    n_bbox_rectangles: int = 0,
+    n_bbox_envelopes: int = 0,
+    n_bbox_subdivided: int = 0,
+    bbox_only: bool = False,
+) -> sql.SQL:
+    """Builds the WHERE clause for a query shape, with a placeholder for every value
+
+    The clause only depends on which filters are present, not on their values,
+    so it is built once per shape and reused across requests.
+    Params are bound separately by GetDataQueryBuilder._where_clause, in order.
+
+    The clause is written as one SQL string rather than composed from
+    Identifier nodes. Identifiers are quoted here instead, which is only safe
+    because the table name is checked against the available OSM categories.
+    """
+    if primary_table not in config.OSM_AVAILABLE_CATEGORIES:
+        raise ValueError(f"{primary_table} is not an available OSM category")
+
+    table = f'"{config.OSM_SCHEMA_NAME}"."{primary_table}"'
+
+    # Always filter by osm type to throttle data output!
+    # The type, subtype and bbox filters all reference the bare columns, so the
+    # composite GiST index on (osm_type, osm_subtype, geom) created with each
+    # category's materialized view can serve them in one scan.
+    # Types are bound as one array, so the statement text is the same however
+    # many are requested
+    clauses = [f'WHERE {table}."osm_type" = ANY(%s)']
+
+    if has_subtypes:
+        clauses.append(f'AND {table}."osm_subtype" = ANY(%s)')
+
+    if has_geom_type:
+        clauses.append(f"AND {table}.geom_type = %s")
+
+    # If a bounding box GeoJSON is passed in, use as filter
+    if n_bbox_rectangles or n_bbox_envelopes or n_bbox_subdivided:
+        geom = f'{table}."{config.OSM_COLUMN_GEOM}"'
+        # Bounding box only queries compare against the stored envelope of
+        # each feature. It is a few points, where geom can be a long line or
+        # large polygon that has to be read to recheck an index match.
+        overlap_column = (
+            f'{table}."{config.OSM_COLUMN_BBOX}"' if bbox_only else geom
+        )
+
+        # && against the bare column can use its GiST index. The bbox is moved
+        # to the column's SRID; transforming the column instead would hide it
+        # from the index. Polygons are bound as EWKB, which carries the SRID.
+        envelope_filters = [
+            f"{overlap_column} && ST_Envelope(ST_Transform(ST_GeomFromEWKB(%s), "
+            f"{config.OSM_COLUMN_GEOM_SRID}))"
+        ] * n_bbox_envelopes
+
+        # A rectangle is sent as its corners rather than as EWKB. It is its own
+        # envelope, so the index-usable check against the bare column is also
+        # the exact one unless only bounding boxes are compared.
+        rectangle = (
+            "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s), "
+            f"{config.OSM_COLUMN_GEOM_SRID})"
+        )
+        if bbox_only:
+            rectangle_filter = f"{overlap_column} && {rectangle}"
+        else:
+            rectangle_filter = f"ST_Intersects({geom}, {rectangle})"
+        rectangle_filters = [rectangle_filter] * n_bbox_rectangles
+
+        # A large polygon's envelope covers much more than the polygon itself.
+        # It is split into pieces of at most %s vertices, and each piece's
+        # envelope is its own small index lookup against the bare column. The
+        # pieces are built once as an array (an InitPlan), so && ANY stays
+        # indexable inside the OR, where a correlated EXISTS would run per row.
+        pieces = (
+            "ARRAY(SELECT ST_Subdivide(ST_Transform(ST_GeomFromEWKB(%s), "
+            f"{config.OSM_COLUMN_GEOM_SRID}), %s))"
+        )
+        if bbox_only:
+            subdivided_filter = f"{overlap_column} && ANY({pieces})"
+        else:
+            subdivided_filter = (
+                f"({geom} && ANY({pieces}) AND ST_Intersects({geom}, "
+                f"ST_Transform(ST_GeomFromEWKB(%s), {config.OSM_COLUMN_GEOM_SRID})))"
+            )
+        subdivided_filters = [subdivided_filter] * n_bbox_subdivided
+
+        # Handles multiple bounding boxes drawn by user. Rows passing any of
+        # the envelope checks get one exact ST_Intersects against all of those
+        # bboxes collected into one geometry, rather than one per bbox.
+        if envelope_filters and not bbox_only:
+            envelopes = " OR ".join(envelope_filters)
+            if n_bbox_envelopes > 1:
+                envelopes = f"({envelopes})"
+            envelope_filters = [
+                f"({envelopes} AND "
+                f"ST_Intersects(ST_Transform({geom}, %s), ST_GeomFromEWKB(%s)))"
+            ]
+
+        feature_filters = rectangle_filters + envelope_filters + subdivided_filters
+        clauses.append(f"AND ( {' OR '.join(feature_filters)} )")
+
+    return sql.SQL(" ".join(clauses))
+
+
+def _count_vertices(geometry) -> int:
+    """Counts the positions of a GeoJSON geometry, including collection members"""
+    if geometry.type == "GeometryCollection":
+        return sum(_count_vertices(part) for part in geometry.geometries)
+    return _count_positions(geometry.coordinates)
+
+
+def _count_positions(coordinates) -> int:
+    """Counts the positions in nested GeoJSON coordinates"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return 1
+    return sum(_count_positions(part) for part in coordinates)
+
+
+# GeoJSON geometry types and their WKB type codes
+_WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+}
+_WKB_GEOMETRYCOLLECTION = 7
+_EWKB_SRID_FLAG = 0x20000000
+
+
+def _wkb_body(geometry_type: str, coordinates) -> bytes:
+    """Little-endian WKB of GeoJSON coordinates, without the byte order and
+    type header. Only x and y are written.
+    """
+    if geometry_type == "Point":
+        return struct.pack("<2d", *coordinates[:2])
+    if geometry_type == "LineString":
+        xy = [value for position in coordinates for value in position[:2]]
+        return struct.pack(f"<I{len(xy)}d", len(coordinates), *xy)
+    if geometry_type == "Polygon":
+        return struct.pack("<I", len(coordinates)) + b"".join(
+            _wkb_body("LineString", ring) for ring in coordinates
+        )
+    # Multi* geometries are a count followed by each part as full WKB
+    part_type = geometry_type[len("Multi") :]
+    return struct.pack("<I", len(coordinates)) + b"".join(
+        struct.pack("<BI", 1, _WKB_TYPES[part_type]) + _wkb_body(part_type, part)
+        for part in coordinates
+    )
+
+
+def _to_wkb(geometry) -> bytes:
+    """Encodes a GeoJSON geometry as little-endian WKB, collections included"""
+    if geometry.type == "GeometryCollection":
+        return _collection_wkb(geometry.geometries)
+    return struct.pack("<BI", 1, _WKB_TYPES[geometry.type]) + _wkb_body(
+        geometry.type, geometry.coordinates
+    )
+
+
+def _collection_wkb(geometries, srid: Optional[int] = None) -> bytes:
+    """Encodes GeoJSON geometries as a WKB GeometryCollection, or as EWKB if
+    an SRID is given. Members are plain WKB, they share the collection's SRID.
+    """
+    if srid is None:
+        header = struct.pack("<BI", 1, _WKB_GEOMETRYCOLLECTION)
+    else:
+        header = struct.pack(
+            "<BII", 1, _WKB_GEOMETRYCOLLECTION | _EWKB_SRID_FLAG, srid
+        )
+    return (
+        header
+        + struct.pack("<I", len(geometries))
+        + b"".join(_to_wkb(geometry) for geometry in geometries)
+    )
+
+
+def _to_ewkb(geometry, srid: int) -> bytes:
+    """Encodes a GeoJSON geometry as EWKB for ST_GeomFromEWKB
+
+    Binary coordinates are read by PostGIS as is, where WKT has every number
+    formatted here and parsed again by the server.
+    """
+    if geometry.type == "GeometryCollection":
+        return _collection_wkb(geometry.geometries, srid)
+    return struct.pack(
+        "<BII", 1, _WKB_TYPES[geometry.type] | _EWKB_SRID_FLAG, srid
+    ) + _wkb_body(geometry.type, geometry.coordinates)
+
+
+def _collect_ewkb(geometries, srid: int) -> bytes:
+    """Encodes GeoJSON geometries as one EWKB GeometryCollection"""
+    return _collection_wkb(geometries, srid)
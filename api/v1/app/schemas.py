@@ -48,6 +48,7 @@ class GetDataInputParameters(BaseModel):
     """
 
     osm_category: str
+    # Lists, so they can be bound directly as = ANY(%s) array params
     osm_types: List[str]
     osm_subtypes: Optional[List[str]] = None
     bbox: Optional[FeatureCollection] = None
@@ -0,0 +1,39 @@
+import pytest
+from psycopg2 import sql
+
+
+def render_sql(composable: sql.Composable) -> str:
+    """Renders a psycopg2 Composable to a string without a database connection
+
+    Composable.as_string needs a live connection to quote identifiers. The
+    quoting rules used here (double quotes, doubled embedded quotes) match what
+    PostgreSQL returns for the identifiers used in the tests.
+    """
+    if isinstance(composable, sql.Composed):
+        return "".join(render_sql(part) for part in composable.seq)
+    if isinstance(composable, sql.SQL):
+        return composable.string
+    if isinstance(composable, sql.Identifier):
+        return ".".join(
+            '"' + string.replace('"', '""') + '"' for string in composable.strings
+        )
+    if isinstance(composable, sql.Placeholder):
+        return f"%({composable.name})s" if composable.name else "%s"
+    raise TypeError(f"Cannot render {type(composable).__name__}")
+
+
+def normalize_sql(text: str) -> str:
+    """Collapses runs of whitespace, so layout changes in the builders don't
+    break comparisons that are about the SQL itself
+    """
+    return " ".join(text.split())
+
+
+@pytest.fixture(scope="session")
+def rendered():
+    """Renders query builder output to a normalized SQL string for comparison
+
+    Expected strings are compared against this, so they are written with
+    single spaces.
+    """
+    return lambda composable: normalize_sql(render_sql(composable))
@@ -1,694 +1,506 @@
+import json
+import math
+from pathlib import Path
+from types import MappingProxyType
 from unittest.mock import MagicMock, patch
 
 import pytest
-from geojson_pydantic import FeatureCollection
-from psycopg2.sql import SQL, Composed, Identifier
+from geojson_pydantic import Feature, FeatureCollection, GeometryCollection, Polygon
+from geojson_pydantic.types import Position2D
 
 from ..app import query, schemas
 
-TEST_BBOX = {
-    "type": "FeatureCollection",
-    "features": [
-        {
-            "type": "Feature",
-            "properties": {
-                "type": "rectangle",
-                "_bounds": [
-                    {"lat": 47.61402337357123, "lng": -119.32662963867189},
-                    {"lat": 47.62651702078168, "lng": -119.27650451660158},
-                ],
-                "_leaflet_id": 11228,
-            },
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [
-                    [
-                        [-119.32662963867189, 47.61402337357123],
-                        [-119.32662963867189, 47.62651702078168],
-                        [-119.27650451660158, 47.62651702078168],
-                        [-119.27650451660158, 47.61402337357123],
-                        [-119.32662963867189, 47.61402337357123],
-                    ]
-                ],
-            },
-        },
-        {
-            "type": "Feature",
-            "properties": {
-                "type": "rectangle",
-                "_bounds": [
-                    {"lat": 47.49541671416695, "lng": -119.30191040039064},
-                    {"lat": 47.50747495167563, "lng": -119.27444458007814},
-                ],
-                "_leaflet_id": 11242,
-            },
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [
-                    [
-                        [-119.30191040039064, 47.49541671416695],
-                        [-119.30191040039064, 47.50747495167563],
-                        [-119.27444458007814, 47.50747495167563],
-                        [-119.27444458007814, 47.49541671416695],
-                        [-119.30191040039064, 47.49541671416695],
-                    ]
-                ],
-            },
-        },
-    ],
-}
+# Two rectangles drawn on the map, as sent by the frontend
+TEST_BBOX_PATH = Path(__file__).parent / "fixtures" / "bbox.json"
 
 
-@pytest.mark.parametrize(
-    "input_params, expected_select_statement, expected_params",
-    [
-        # Select with climate arguments
-        (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                epsg_code=4326,
-                climate_variable="burntFractionAll",
-                climate_decade=[2060, 2070],
-                climate_month=[8, 9],
-                climate_ssp=126,
-            ),
-            Composed(
-                [
-                    SQL("SELECT "),
-                    Composed(
-                        [
-                            Identifier("osm", "infrastructure", "osm_id"),
-                            SQL(", "),
-                            Identifier("osm", "infrastructure", "osm_type"),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL(" AS osm_tags"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s) AS geometry"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_AsText(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s), 3) AS geometry_wkt"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_X(ST_Centroid(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s))) AS longitude"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_Y(ST_Centroid(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s))) AS latitude"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Identifier("osm", "infrastructure", "osm_subtype"),
-                            SQL(", "),
-                            Composed([Identifier("county"), SQL(".name AS county")]),
-                            SQL(", "),
-                            Composed([Identifier("city"), SQL(".name AS city")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ssp")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".month")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".decade")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_mean")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_median")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_stddev")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_min")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_max")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_q1")]),
-                            SQL(", "),
-                            Composed([Identifier("climate_table"), SQL(".ensemble_q3")]),
-                        ]
-                    ),
-                ]
-            ),
-            [4326, 4326, 4326, 4326],
-        ),
-        # Climate query test case 1 - Any climate argument that is None will result in no climate columns returned
-        (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                epsg_code=4326,
-                climate_variable=None,
-                climate_decade=None,
-                climate_month=None,
-                climate_ssp=None,
-            ),
-            Composed(
-                [
-                    SQL("SELECT "),
-                    Composed(
-                        [
-                            Identifier("osm", "infrastructure", "osm_id"),
-                            SQL(", "),
-                            Identifier("osm", "infrastructure", "osm_type"),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL(" AS osm_tags"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s) AS geometry"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_AsText(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s), 3) AS geometry_wkt"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_X(ST_Centroid(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s))) AS longitude"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    SQL("ST_Y(ST_Centroid(ST_Transform("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", %s))) AS latitude"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Identifier("osm", "infrastructure", "osm_subtype"),
-                            SQL(", "),
-                            Composed(
-                                [
-                                    Identifier("county"),
-                                    SQL(".name AS county"),
-                                ]
-                            ),
-                            SQL(", "),
-                            Composed([Identifier("city"), SQL(".name AS city")]),
-                        ]
-                    ),
-                ]
-            ),
-            [4326, 4326, 4326, 4326],
-        ),
-    ],
+# Shared input params. Read-only mappings with tuple values, so cases can
+# reference them without copying and no test can mutate them for another.
+FULL_PARAMS = MappingProxyType(
+    dict(
+        osm_category="infrastructure",
+        osm_types=("power",),
+        osm_subtypes=("line",),
+        epsg_code=4326,
+        climate_variable="burntFractionAll",
+        climate_decade=(2060, 2070),
+        climate_month=(8, 9),
+        climate_ssp=126,
+    )
 )
-def test_create_select_statement(
-    input_params, expected_select_statement, expected_params
-):
 
-    query_builder = query.GetDataQueryBuilder(input_params=input_params)
+NO_CLIMATE_PARAMS = MappingProxyType(
+    {
+        **FULL_PARAMS,
+        "climate_variable": None,
+        "climate_decade": None,
+        "climate_month": None,
+        "climate_ssp": None,
+    }
+)
+
+
+@pytest.fixture(scope="session")
+def bbox_geojson():
+    """The raw bbox GeoJSON, read when a test first needs it rather than at collection"""
+    return json.loads(TEST_BBOX_PATH.read_bytes())
+
 
-    generated_select_statement, generated_params = (
-        query_builder._create_select_statement()
+@pytest.fixture(scope="session")
+def bbox_fc(bbox_geojson):
+    """bbox_geojson as a FeatureCollection, built once when a test first needs it
+
+    bbox_geojson is a fixed, known-valid payload, so the models are built with
+    model_construct rather than validated. Coordinates are still wrapped as
+    Position2D so the result is equal to the validated FeatureCollection.
+    """
+    return FeatureCollection.model_construct(
+        type=bbox_geojson["type"],
+        features=[
+            Feature.model_construct(
+                type=feature["type"],
+                properties=feature["properties"],
+                geometry=Polygon.model_construct(
+                    type=feature["geometry"]["type"],
+                    coordinates=[
+                        [Position2D(*position) for position in ring]
+                        for ring in feature["geometry"]["coordinates"]
+                    ],
+                ),
+            )
+            for feature in bbox_geojson["features"]
+        ],
     )
 
-    assert generated_select_statement == expected_select_statement
-    assert generated_params == expected_params
 
+def make_input_params(params, bbox_fc):
+    """Validates a case's params, swapping a bbox=True flag for the shared bbox
 
-@pytest.mark.parametrize(
-    "input_params, expected_from_statement",
-    [
-        (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                epsg_code=4326,
-                climate_variable="burntFractionAll",
-                climate_decade=[2060, 2070],
-                climate_month=[8, 9],
-                climate_ssp=126,
-            ),
-            Composed(
-                [
-                    SQL("FROM "),
-                    Identifier("osm"),
-                    SQL("."),
-                    Identifier("infrastructure"),
-                ]
-            ),
-        )
-    ],
+    Cases hold plain mappings so nothing is validated at collection time.
+    """
+    if params.get("bbox") is True:
+        params = {**params, "bbox": bbox_fc}
+    return schemas.GetDataInputParameters(**params)
+
+
+@pytest.fixture(scope="module")
+def builder_cache():
+    """Query builders shared by the tests in this module, keyed by input params"""
+    return {}
+
+
+def get_query_builder(builder_cache, input_params):
+    """Returns the cached builder for input_params, creating it on first use"""
+    key = input_params.model_dump_json()
+    if key not in builder_cache:
+        builder_cache[key] = query.GetDataQueryBuilder(input_params=input_params)
+    return builder_cache[key]
+
+
+SELECT_BASE = (
+    'SELECT "osm"."infrastructure"."osm_id", "osm"."infrastructure"."osm_type", '
+    '"osm"."tags"."tags" AS osm_tags, '
+    'ST_Transform("osm"."infrastructure"."geom", %s) AS geometry, '
+    'ST_AsText(ST_Transform("osm"."infrastructure"."geom", %s), 3) AS geometry_wkt, '
+    'ST_X(ST_Centroid(ST_Transform("osm"."infrastructure"."geom", %s))) AS longitude, '
+    'ST_Y(ST_Centroid(ST_Transform("osm"."infrastructure"."geom", %s))) AS latitude, '
+    '"osm"."infrastructure"."osm_subtype", "county".name AS county, "city".name AS city'
 )
-def test_create_from_statement(input_params, expected_from_statement):
 
-    query_builder = query.GetDataQueryBuilder(input_params=input_params)
+JOIN_BASE = (
+    'JOIN "osm"."tags" ON "osm".infrastructure.osm_id = "osm"."tags".osm_id '
+    'LEFT JOIN "osm"."place_polygon" "county"'
+    'ON ST_Intersects("osm"."infrastructure"."geom", "county"."geom") '
+    'AND "county".admin_level = %s '
+    'LEFT JOIN "osm"."place_polygon" "city"'
+    'ON ST_Intersects("osm"."infrastructure"."geom", "city"."geom") '
+    'AND "city".admin_level = %s'
+)
 
-    generated_from_statement = query_builder._create_from_statement()
 
-    assert generated_from_statement == expected_from_statement
+CLIMATE_SELECT = (
+    SELECT_BASE
+    + ', "climate_table".ssp, "climate_table".month, "climate_table".decade, '
+    '"climate_table".ensemble_mean, "climate_table".ensemble_median, '
+    '"climate_table".ensemble_stddev, "climate_table".ensemble_min, '
+    '"climate_table".ensemble_max, "climate_table".ensemble_q1, '
+    '"climate_table".ensemble_q3'
+)
+
+WHERE_BASE = (
+    'WHERE "osm"."infrastructure"."osm_type" = ANY(%s) '
+    'AND "osm"."infrastructure"."osm_subtype" = ANY(%s)'
+)
 
 
+# Index-usable bounding box check, and the exact intersection it guards
+BBOX_PREFILTER = (
+    '"osm"."infrastructure"."geom" && '
+    "ST_Envelope(ST_Transform(ST_GeomFromEWKB(%s), 4326))"
+)
+BBOX_INTERSECTS = (
+    'ST_Intersects(ST_Transform("osm"."infrastructure"."geom", %s), '
+    "ST_GeomFromEWKB(%s))"
+)
+
+# The test bbox features are rectangles, sent as ST_MakeEnvelope corners
+BBOX_RECTANGLE = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s), 4326)"
+BBOX_ENVELOPE_PARAMS = (
+    (-119.32662963867189, 47.61402337357123, -119.27650451660158, 47.62651702078168, 4326),
+    (-119.30191040039064, 47.49541671416695, -119.27444458007814, 47.50747495167563, 4326),
+)
+
+EPSG_PARAMS = (4326, 4326, 4326, 4326)
+ADMIN_JOIN_PARAMS = (6, 8)
+CLIMATE_JOIN_PARAMS = (*ADMIN_JOIN_PARAMS, 126, [2060, 2070], [8, 9])
+WHERE_BASE_PARAMS = (["power"], ["line"])
+
+
+# Each expected clause is a (sql, params) pair, or None where a case doesn't check it
 @pytest.mark.parametrize(
-    "input_params, expected_join_statement, expected_params",
+    "input_params, expected_select, expected_from, expected_join, expected_where",
     [
-        # Test case with all possible input params
+        # Test case with climate arguments
         (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                epsg_code=4326,
-                climate_variable="fwi",
-                climate_decade=[2060, 2070],
-                climate_month=[8, 9],
-                climate_ssp=126,
-            ),
-            Composed(
-                [
-                    Composed(
-                        [
-                            Composed(
-                                [
-                                    Composed(
-                                        [
-                                            SQL("JOIN "),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            Identifier("tags"),
-                                            SQL(" ON "),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            SQL("infrastructure"),
-                                            SQL(".osm_id = "),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            Identifier("tags"),
-                                            SQL(".osm_id"),
-                                        ]
-                                    ),
-                                    SQL(" "),
-                                    Composed(
-                                        [
-                                            SQL("LEFT JOIN "),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            Identifier("place_polygon"),
-                                            SQL(" "),
-                                            Identifier("county"),
-                                            SQL("ON ST_Intersects("),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            Identifier("infrastructure"),
-                                            SQL("."),
-                                            Identifier("geom"),
-                                            SQL(", "),
-                                            Identifier("county"),
-                                            SQL("."),
-                                            Identifier("geom"),
-                                            SQL(") AND "),
-                                            Identifier("county"),
-                                            SQL(".admin_level = %s "),
-                                        ]
-                                    ),
-                                ]
-                            ),
-                            SQL(" "),
-                            Composed(
-                                [
-                                    SQL("LEFT JOIN "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("place_polygon"),
-                                    SQL(" "),
-                                    Identifier("city"),
-                                    SQL("ON ST_Intersects("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", "),
-                                    Identifier("city"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(") AND "),
-                                    Identifier("city"),
-                                    SQL(".admin_level = %s "),
-                                ]
-                            ),
-                        ]
-                    ),
-                    SQL(" "),
-                    Composed(
-                        [
-                            SQL("INNER JOIN ("),
-                            SQL(
-                                "SELECT s.osm_id, s.ssp, s.month, s.decade, "
-                                "s.value_mean AS ensemble_mean, s.value_median AS ensemble_median, "
-                                "s.value_stddev AS ensemble_stddev, s.value_min AS ensemble_min, "
-                                "s.value_max AS ensemble_max, s.value_q1 AS ensemble_q1, "
-                                "s.value_q3 AS ensemble_q3 "
-                            ),
-                            Composed(
-                                [
-                                    SQL("FROM "),
-                                    Identifier("climate"),
-                                    SQL("."),
-                                    Identifier("nasa_nex_fwi"),
-                                    SQL(" s "),
-                                ]
-                            ),
-                            SQL("WHERE s.ssp = %s AND s.decade IN %s AND s.month IN %s"),
-                            Composed([SQL(") AS "), Identifier("climate_table"), SQL(" ")]),
-                            Composed(
-                                [
-                                    SQL("ON "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL(".osm_id = "),
-                                    Identifier("climate_table"),
-                                    SQL(".osm_id"),
-                                ]
-                            ),
-                        ]
-                    ),
-                ]
+            {**FULL_PARAMS, "climate_variable": "fwi"},
+            (CLIMATE_SELECT, EPSG_PARAMS),
+            'FROM "osm"."infrastructure"',
+            (
+                JOIN_BASE
+                + " INNER JOIN (SELECT s.osm_id, s.ssp, s.month, s.decade, "
+                "s.value_mean AS ensemble_mean, s.value_median AS ensemble_median, "
+                "s.value_stddev AS ensemble_stddev, s.value_min AS ensemble_min, "
+                "s.value_max AS ensemble_max, s.value_q1 AS ensemble_q1, "
+                "s.value_q3 AS ensemble_q3 "
+                'FROM "climate"."nasa_nex_fwi" s '
+                "WHERE s.ssp = %s AND s.decade = ANY(%s) AND s.month = ANY(%s)"
+                ') AS "climate_table" '
+                'ON "osm"."infrastructure".osm_id = "climate_table".osm_id',
+                CLIMATE_JOIN_PARAMS,
             ),
-            [6, 8, 126, (2060, 2070), (8, 9)],
+            (WHERE_BASE, WHERE_BASE_PARAMS),
         ),
-        # Test case no climate
+        # Any climate argument that is None will result in no climate columns or join
         (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                epsg_code=4326,
-                climate_variable=None,
-                climate_decade=None,
-                climate_month=None,
-                climate_ssp=None,
-            ),
-            Composed(
-                [
-                    Composed(
-                        [
-                            Composed(
-                                [
-                                    SQL("JOIN "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL(" ON "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    SQL("infrastructure"),
-                                    SQL(".osm_id = "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("tags"),
-                                    SQL(".osm_id"),
-                                ]
-                            ),
-                            SQL(" "),
-                            Composed(
-                                [
-                                    SQL("LEFT JOIN "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("place_polygon"),
-                                    SQL(" "),
-                                    Identifier("county"),
-                                    SQL("ON ST_Intersects("),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(", "),
-                                    Identifier("county"),
-                                    SQL("."),
-                                    Identifier("geom"),
-                                    SQL(") AND "),
-                                    Identifier("county"),
-                                    SQL(".admin_level = %s "),
-                                ]
-                            ),
-                        ]
-                    ),
-                    SQL(" "),
-                    Composed(
-                        [
-                            SQL("LEFT JOIN "),
-                            Identifier("osm"),
-                            SQL("."),
-                            Identifier("place_polygon"),
-                            SQL(" "),
-                            Identifier("city"),
-                            SQL("ON ST_Intersects("),
-                            Identifier("osm"),
-                            SQL("."),
-                            Identifier("infrastructure"),
-                            SQL("."),
-                            Identifier("geom"),
-                            SQL(", "),
-                            Identifier("city"),
-                            SQL("."),
-                            Identifier("geom"),
-                            SQL(") AND "),
-                            Identifier("city"),
-                            SQL(".admin_level = %s "),
-                        ]
-                    ),
-                ]
+            NO_CLIMATE_PARAMS,
+            (SELECT_BASE, EPSG_PARAMS),
+            'FROM "osm"."infrastructure"',
+            (JOIN_BASE, ADMIN_JOIN_PARAMS),
+            (WHERE_BASE, WHERE_BASE_PARAMS),
+        ),
+        # Test case with a bounding box of two features
+        (
+            {**FULL_PARAMS, "bbox": True},
+            (CLIMATE_SELECT, EPSG_PARAMS),
+            None,
+            None,
+            (
+                WHERE_BASE
+                + " AND ( "
+                f'ST_Intersects("osm"."infrastructure"."geom", {BBOX_RECTANGLE}) '
+                "OR "
+                f'ST_Intersects("osm"."infrastructure"."geom", {BBOX_RECTANGLE}) '
+                ")",
+                (
+                    *WHERE_BASE_PARAMS,
+                    *BBOX_ENVELOPE_PARAMS[0],
+                    *BBOX_ENVELOPE_PARAMS[1],
+                ),
             ),
-            [6, 8],
         ),
     ],
+    ids=["climate", "no_climate", "bbox"],
 )
-def test_create_join_statement(input_params, expected_join_statement, expected_params):
-
-    query_builder = query.GetDataQueryBuilder(input_params=input_params)
-    generated_join_statement, generated_params = query_builder._create_join_statement()
+def test_create_all_clauses(
+    builder_cache,
+    bbox_fc,
+    rendered,
+    input_params,
+    expected_select,
+    expected_from,
+    expected_join,
+    expected_where,
+):
+    input_params = make_input_params(input_params, bbox_fc)
+    query_builder = get_query_builder(builder_cache, input_params)
 
-    assert generated_join_statement == expected_join_statement
-    assert generated_params == expected_params
+    if expected_select is not None:
+        generated_select_statement, generated_params = (
+            query_builder._select_statement
+        )
+        assert rendered(generated_select_statement) == expected_select[0]
+        assert tuple(generated_params) == expected_select[1]
 
+    if expected_from is not None:
+        generated_from_statement = query_builder._from_statement
+        assert rendered(generated_from_statement) == expected_from
 
-@pytest.mark.parametrize(
-    "input_params, expected_where_clause, expected_params",
-    [
-        (
-            schemas.GetDataInputParameters(
-                osm_category="infrastructure",
-                osm_types=["power"],
-                osm_subtypes=["line"],
-                county=True,
-                city=True,
-                epsg_code=4326,
-                climate_variable="burntFractionAll",
-                climate_decade=[2060, 2070],
-                climate_month=[8, 9],
-                climate_ssp=126,
-                bbox=FeatureCollection(
-                    type=TEST_BBOX["type"], features=TEST_BBOX["features"]
-                ),
-            ),
-            Composed(
-                [
-                    Composed(
-                        [
-                            Composed(
-                                [
-                                    SQL("WHERE "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("osm_type"),
-                                    SQL(" IN %s"),
-                                ]
-                            ),
-                            SQL(" "),
-                            Composed(
-                                [
-                                    SQL("AND "),
-                                    Identifier("osm"),
-                                    SQL("."),
-                                    Identifier("infrastructure"),
-                                    SQL("."),
-                                    Identifier("osm_subtype"),
-                                    SQL(" IN %s"),
-                                ]
-                            ),
-                        ]
-                    ),
-                    SQL(" "),
-                    Composed(
-                        [
-                            Composed(
-                                [
-                                    Composed(
-                                        [
-                                            Composed(
-                                                [
-                                                    SQL("AND ("),
-                                                    SQL(" "),
-                                                    Composed(
-                                                        [
-                                                            SQL(
-                                                                "ST_Intersects(ST_Transform("
-                                                            ),
-                                                            Identifier("osm"),
-                                                            SQL("."),
-                                                            Identifier(
-                                                                "infrastructure"
-                                                            ),
-                                                            SQL("."),
-                                                            Identifier("geom"),
-                                                            SQL(
-                                                                ", %s), ST_GeomFromText(%s, %s))"
-                                                            ),
-                                                        ]
-                                                    ),
-                                                ]
-                                            ),
-                                            SQL(" "),
-                                            SQL("OR"),
-                                        ]
-                                    ),
-                                    SQL(" "),
-                                    Composed(
-                                        [
-                                            SQL("ST_Intersects(ST_Transform("),
-                                            Identifier("osm"),
-                                            SQL("."),
-                                            Identifier("infrastructure"),
-                                            SQL("."),
-                                            Identifier("geom"),
-                                            SQL(", %s), ST_GeomFromText(%s, %s))"),
-                                        ]
-                                    ),
-                                ]
-                            ),
-                            SQL(" "),
-                            SQL(")"),
-                        ]
-                    ),
-                ]
-            ),
-            [
-                ("power",),
-                ("line",),
-                4326,
-                "POLYGON ((-119.32662963867189 47.61402337357123, -119.32662963867189 47.62651702078168, -119.27650451660158 47.62651702078168, -119.27650451660158 47.61402337357123, -119.32662963867189 47.61402337357123))",
-                4326,
-                4326,
-                "POLYGON ((-119.30191040039064 47.49541671416695, -119.30191040039064 47.50747495167563, -119.27444458007814 47.50747495167563, -119.27444458007814 47.49541671416695, -119.30191040039064 47.49541671416695))",
-                4326,
-            ],
+    if expected_join is not None:
+        generated_join_statement, generated_params = (
+            query_builder._join_statement
         )
-    ],
-)
-def test_create_where_clause(input_params, expected_where_clause, expected_params):
-    query_builder = query.GetDataQueryBuilder(input_params=input_params)
-    generated_where_clause, generated_params = query_builder._create_where_clause()
+        assert rendered(generated_join_statement) == expected_join[0]
+        assert tuple(generated_params) == expected_join[1]
 
-    assert generated_where_clause == expected_where_clause
-    assert generated_params == expected_params
+    if expected_where is not None:
+        generated_where_clause, generated_params = query_builder._where_clause
+        assert rendered(generated_where_clause) == expected_where[0]
+        assert tuple(generated_params) == expected_where[1]
 
 
-def test_create_limit():
+def test_create_limit(builder_cache, bbox_fc, rendered):
     # Set the limit value
-    input_params = schemas.GetDataInputParameters(
-        osm_category="infrastructure",
-        osm_types=["power"],
-        osm_subtypes=["line"],
-        county=True,
-        city=True,
-        epsg_code=4326,
-        climate_variable="burntFractionAll",
-        climate_decade=[2060, 2070],
-        climate_month=[8, 9],
-        climate_ssp=126,
-        bbox=FeatureCollection(type=TEST_BBOX["type"], features=TEST_BBOX["features"]),
-        limit=10,
-    )
-    query_builder = query.GetDataQueryBuilder(input_params=input_params)
+    input_params = make_input_params({**FULL_PARAMS, "bbox": True, "limit": 10}, bbox_fc)
+    query_builder = get_query_builder(builder_cache, input_params)
 
     limit_statement, params = query_builder._create_limit()
 
     # Check the results
-    assert limit_statement == SQL("LIMIT %s")
+    assert rendered(limit_statement) == "LIMIT %s"
     assert params == [10]
+
+
+def test_bbox_fc_matches_validated(bbox_fc, bbox_geojson):
+    # Guards the unvalidated fixture against drifting from the real model
+    assert bbox_fc == FeatureCollection(**bbox_geojson)
+
+
+def test_clauses_are_built_once_per_builder():
+    # A count and a select query over the same builder reuse the built clauses
+    query_builder = query.GetDataQueryBuilder(
+        schemas.GetDataInputParameters(**FULL_PARAMS)
+    )
+
+    assert query_builder._where_clause is query_builder._where_clause
+    assert query_builder._join_statement is query_builder._join_statement
+    assert query_builder.build_query() == query_builder.build_query()
+
+
+def test_where_template_is_shared_across_values():
+    # Builders that differ only in filter values reuse the same cached clause
+    first = query.GetDataQueryBuilder(schemas.GetDataInputParameters(**FULL_PARAMS))
+    second = query.GetDataQueryBuilder(
+        schemas.GetDataInputParameters(
+            **{**FULL_PARAMS, "osm_types": ("power", "man_made")}
+        )
+    )
+
+    assert first._where_clause[0] is second._where_clause[0]
+    assert second._where_clause[1][0] == ["power", "man_made"]
+
+
+def test_climate_join_text_ignores_list_lengths(rendered):
+    # Decades and months are bound as arrays, so one or several give the same SQL
+    one = query.GetDataQueryBuilder(
+        schemas.GetDataInputParameters(
+            **{**FULL_PARAMS, "climate_decade": (2060,), "climate_month": (8,)}
+        )
+    )
+    several = query.GetDataQueryBuilder(schemas.GetDataInputParameters(**FULL_PARAMS))
+
+    assert rendered(one._join_statement[0]) == rendered(several._join_statement[0])
+    assert one._join_statement[1][-2:] == [[2060], [8]]
+
+
+def test_where_template_rejects_unknown_table():
+    # Table names are written into the SQL string, so only known categories pass
+    with pytest.raises(ValueError):
+        query._build_where_template(
+            primary_table='infrastructure"; DROP TABLE osm.tags; --',
+            has_subtypes=False,
+            has_geom_type=False,
+        )
+
+
+def test_create_where_clause_bbox_only(bbox_fc, rendered):
+    input_params = make_input_params({**FULL_PARAMS, "bbox": True}, bbox_fc)
+    query_builder = query.GetDataQueryBuilder(input_params, bbox_only=True)
+
+    where_clause, params = query_builder._where_clause
+
+    # Only the stored bbox column is compared, not the full geometry
+    assert rendered(where_clause) == (
+        WHERE_BASE
+        + f' AND ( "osm"."infrastructure"."bbox" && {BBOX_RECTANGLE} '
+        f'OR "osm"."infrastructure"."bbox" && {BBOX_RECTANGLE} )'
+    )
+    assert tuple(params) == (
+        *WHERE_BASE_PARAMS,
+        *BBOX_ENVELOPE_PARAMS[0],
+        *BBOX_ENVELOPE_PARAMS[1],
+    )
+
+
+def test_create_where_clause_polygon_bbox(rendered):
+    # Triangles aren't rectangles, so they are sent as EWKB, checked against
+    # their envelopes, then intersected once as a collection
+    bbox = FeatureCollection(
+        type="FeatureCollection",
+        features=[
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+            for ring in (
+                [[-119.33, 47.61], [-119.28, 47.61], [-119.30, 47.63], [-119.33, 47.61]],
+                [[-119.30, 47.49], [-119.27, 47.49], [-119.27, 47.51], [-119.30, 47.49]],
+            )
+        ],
+    )
+    input_params = schemas.GetDataInputParameters(**FULL_PARAMS, bbox=bbox)
+    query_builder = query.GetDataQueryBuilder(input_params)
+
+    where_clause, params = query_builder._where_clause
+
+    ewkb = [query._to_ewkb(feature.geometry, 4326) for feature in bbox.features]
+    assert rendered(where_clause) == (
+        WHERE_BASE
+        + f" AND ( (({BBOX_PREFILTER} OR {BBOX_PREFILTER}) AND {BBOX_INTERSECTS}) )"
+    )
+    assert tuple(params) == (
+        *WHERE_BASE_PARAMS,
+        ewkb[0],
+        ewkb[1],
+        4326,
+        query._collect_ewkb([f.geometry for f in bbox.features], 4326),
+    )
+
+
+def _circle_feature(vertices: int = 100) -> dict:
+    """A polygon feature with a ring of the given vertex count, near the test bboxes"""
+    angles = [2 * math.pi * i / (vertices - 1) for i in range(vertices - 1)]
+    ring = [[-119.3 + 0.01 * math.cos(a), 47.6 + 0.01 * math.sin(a)] for a in angles]
+    ring.append(ring[0])
+    return {
+        "type": "Feature",
+        "properties": {},
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+
+
+# Large polygons are matched against the envelopes of their subdivided pieces
+BBOX_PIECES = "ARRAY(SELECT ST_Subdivide(ST_Transform(ST_GeomFromEWKB(%s), 4326), %s))"
+BBOX_SUBDIVIDED = (
+    f'("osm"."infrastructure"."geom" && ANY({BBOX_PIECES}) AND '
+    'ST_Intersects("osm"."infrastructure"."geom", '
+    "ST_Transform(ST_GeomFromEWKB(%s), 4326)))"
+)
+
+
+def test_create_where_clause_subdivides_large_bbox(rendered):
+    # A 100 vertex ring, well over the subdivide threshold
+    bbox = FeatureCollection(type="FeatureCollection", features=[_circle_feature()])
+    input_params = schemas.GetDataInputParameters(**FULL_PARAMS, bbox=bbox)
+    query_builder = query.GetDataQueryBuilder(input_params)
+
+    where_clause, params = query_builder._where_clause
+
+    ewkb = query._to_ewkb(bbox.features[0].geometry, 4326)
+    assert rendered(where_clause) == WHERE_BASE + f" AND ( {BBOX_SUBDIVIDED} )"
+    assert tuple(params) == (
+        *WHERE_BASE_PARAMS,
+        ewkb,
+        query.GetDataQueryBuilder._bbox_subdivide_max_vertices,
+        ewkb,
+    )
+
+
+@pytest.mark.parametrize("bbox_only", [False, True])
+def test_create_where_clause_rectangle_and_large_bbox(bbox_geojson, bbox_only, rendered):
+    # A drawn rectangle and a large polygon in one request, each keeps its own
+    # index-usable filter within the OR
+    bbox = FeatureCollection(
+        type="FeatureCollection",
+        features=[bbox_geojson["features"][0], _circle_feature()],
+    )
+    input_params = schemas.GetDataInputParameters(**FULL_PARAMS, bbox=bbox)
+    query_builder = query.GetDataQueryBuilder(input_params, bbox_only=bbox_only)
+
+    where_clause, params = query_builder._where_clause
+
+    ewkb = query._to_ewkb(bbox.features[1].geometry, 4326)
+    max_vertices = query.GetDataQueryBuilder._bbox_subdivide_max_vertices
+    if bbox_only:
+        expected = (
+            f'"osm"."infrastructure"."bbox" && {BBOX_RECTANGLE} '
+            f'OR "osm"."infrastructure"."bbox" && ANY({BBOX_PIECES})'
+        )
+        expected_params = (ewkb, max_vertices)
+    else:
+        expected = (
+            f'ST_Intersects("osm"."infrastructure"."geom", {BBOX_RECTANGLE}) '
+            f"OR {BBOX_SUBDIVIDED}"
+        )
+        expected_params = (ewkb, max_vertices, ewkb)
+    assert rendered(where_clause) == WHERE_BASE + f" AND ( {expected} )"
+    assert tuple(params) == (
+        *WHERE_BASE_PARAMS,
+        *BBOX_ENVELOPE_PARAMS[0],
+        *expected_params,
+    )
+
+
+def test_to_ewkb_polygon():
+    # Reference bytes from shapely.wkb.dumps(..., srid=4326, byte_order=1)
+    triangle = Polygon(type="Polygon", coordinates=[[[0, 0], [1, 0], [0, 1], [0, 0]]])
+
+    assert query._to_ewkb(triangle, 4326) == bytes.fromhex(
+        "0103000020E61000000100000004000000"
+        "00000000000000000000000000000000"
+        "000000000000F03F0000000000000000"
+        "0000000000000000000000000000F03F"
+        "00000000000000000000000000000000"
+    )
+
+
+def test_to_ewkb_geometry_collection():
+    # Reference bytes from shapely.wkb.dumps(..., srid=4326, byte_order=1)
+    collection = GeometryCollection(
+        type="GeometryCollection",
+        geometries=[
+            {"type": "Point", "coordinates": [2, 3]},
+            {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [0, 1], [0, 0]]]},
+        ],
+    )
+
+    assert query._to_ewkb(collection, 4326) == bytes.fromhex(
+        "0107000020E610000002000000010100"
+        "00000000000000000040000000000000"
+        "08400103000000010000000400000000"
+        "00000000000000000000000000000000"
+        "0000000000F03F000000000000000000"
+        "00000000000000000000000000F03F00"
+        "000000000000000000000000000000"
+    )
+
+
+def test_create_where_clause_geometry_collection_bbox(rendered):
+    # Collections are bound as EWKB like any other non-rectangular bbox
+    feature = _circle_feature(vertices=10)
+    bbox = FeatureCollection(
+        type="FeatureCollection",
+        features=[
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {
+                    "type": "GeometryCollection",
+                    "geometries": [
+                        {"type": "Point", "coordinates": [-119.3, 47.6]},
+                        feature["geometry"],
+                    ],
+                },
+            }
+        ],
+    )
+    input_params = schemas.GetDataInputParameters(**FULL_PARAMS, bbox=bbox)
+    query_builder = query.GetDataQueryBuilder(input_params)
+
+    where_clause, params = query_builder._where_clause
+
+    ewkb = query._to_ewkb(bbox.features[0].geometry, 4326)
+    assert rendered(where_clause) == (
+        WHERE_BASE + f" AND ( ({BBOX_PREFILTER} AND {BBOX_INTERSECTS}) )"
+    )
+    assert tuple(params) == (*WHERE_BASE_PARAMS, ewkb, 4326, ewkb)
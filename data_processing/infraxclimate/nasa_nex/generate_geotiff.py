@@ -1,9 +1,9 @@
-import json
 from pathlib import Path
 from typing import Dict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 
+import orjson
 import rioxarray
 import xarray as xr
 
@@ -12,9 +12,17 @@ import constants
 logger = logging.getLogger(__name__)
 
 def save_geotiff(data: tuple) -> None:
-    """Helper function to save individual geotiff"""
+    """Helper function to save individual geotiff
+
+    Reductions come out of xarray as float64, which is far more precision than
+    the climate values carry. Writing float32 halves the COG size, and ZSTD with
+    the floating point predictor compresses the smooth climate grids well.
+    """
     da, output_path = data
-    da.rio.to_raster(str(output_path), driver="COG")
+    da = da.astype("float32")
+    da.rio.to_raster(
+        str(output_path), driver="COG", compress="ZSTD", predictor="FLOATING_POINT"
+    )
     logger.info(f"Saved {output_path}")
 
 def main(
@@ -27,11 +35,15 @@ def main(
     if not state:
         state = "global"
 
+    # For visualizing climate grid, we just use the mean. The pipeline passes
+    # an in-memory dataset, so the per-month writes and the min/max below read
+    # the same arrays rather than recomputing them.
+    da = ds["value_mean"]
+
     # Prepare all the data tuples for parallel processing
     save_tasks = []
     for decade_month in ds["decade_month"].data:
-        # For visualizing climate grid, we just use the mean
-        _da = ds[f"value_mean"].sel(decade_month=decade_month)
+        _da = da.sel(decade_month=decade_month)
         file_name = f"{decade_month}-{state}.tif"
         output_path = Path(output_dir) / file_name
         save_tasks.append((_da, output_path))
@@ -46,16 +58,16 @@ def main(
                 logger.error(f"Error saving geotiff: {str(e)}")
 
     # Save metadata file
-    metadata[constants.METADATA_KEY]["max_climate_variable_value"] = float(
-        ds[f"value_mean"].max()
-    )
-    metadata[constants.METADATA_KEY]["min_climate_variable_value"] = float(
-        ds[f"value_mean"].min()
-    )
+    max_value, min_value = da.max(), da.min()
+    metadata[constants.METADATA_KEY]["max_climate_variable_value"] = float(max_value)
+    metadata[constants.METADATA_KEY]["min_climate_variable_value"] = float(min_value)
 
     metadata_file = f"metadata-{state}.json"
     metadata_output_path = Path(output_dir) / metadata_file
-    with open(str(metadata_output_path), "w") as f:
-        json.dump(metadata, f, indent=4)
+    metadata_output_path.write_bytes(
+        orjson.dumps(
+            metadata, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+        )
+    )
 
     logger.info("All geotiffs and metadata saved successfully")
@@ -1,17 +1,25 @@
 import concurrent.futures as cf
+import contextlib
+import functools
+import hashlib
+import heapq
 import logging
+import multiprocessing
 import os
-import json
+import stat
+import tempfile
+import time
+from pathlib import Path
 from typing import Dict, List, Tuple
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 import psycopg2 as pg
+import shapely
 import psycopg2.sql as sql
 import xarray as xr
 import xvec
-from shapely import wkt, Point
 
 import utils
 import constants
@@ -24,32 +32,183 @@ logging.basicConfig(level=logging.INFO)
 ID_COLUMN = "osm_id"
 GEOMETRY_COLUMN = "geometry"
 
+# osm_category -> table names, keyed on (osm_category, dsn). The PG OSM Flex
+# schema does not change between pipeline runs, so one lookup per database is enough.
+_OSM_TABLES_CACHE: Dict[Tuple[str, str], List[str]] = {}
+
+# Parsed infrastructure GeoDataFrames are cached here between pipeline runs, since
+# every climate variable and SSP intersects the same OSM features. The directory
+# must be private to the user running the pipeline, see infra_cache_dir().
+INFRA_CACHE_DIR = Path(
+    os.environ.get(
+        "INFRA_CACHE_DIR", Path.home() / ".cache" / "climate-risk-infra"
+    )
+)
+
+# Cache files older than this are deleted. Entries are keyed on the OSM import,
+# so files for an earlier import are never read again anyway.
+INFRA_CACHE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+# Computed climate data in process pool workers, set by create_climate_pool()
+_SHARED_CLIMATE: xr.Dataset | None = None
+
 
 def convert_ds_to_df(ds: xr.Dataset) -> pd.DataFrame:
     """Converts a DataArray to a Dataframe.
 
     Used since we ultimately want the data in tabular form for PostGIS.
 
+    The xvec output is indexed by the shapely geometry, with the feature id
+    carried as a coordinate along that dimension. The geometry index is swapped
+    for the integer id before stacking, since stacking on shapely objects
+    requires hashing every geometry into the pandas MultiIndex.
+
     Args:
         da (xr.DataArray): Datarray
     """
 
+    ds = ds.swap_dims({GEOMETRY_COLUMN: ID_COLUMN}).drop_vars(GEOMETRY_COLUMN)
+
+    # Split the "YYYY-MM" labels once per decade_month rather than once per row,
+    # the stacked frame then carries decade and month as plain integer columns
+    decade_month = ds["decade_month"].values.astype(str)
+    ds = ds.assign_coords(
+        decade=("decade_month", np.array([dm[:4] for dm in decade_month], dtype=np.int16)),
+        month=("decade_month", np.array([dm[-2:] for dm in decade_month], dtype=np.int8)),
+    )
+    # Without its string labels the dimension stacks on a plain integer range,
+    # so no object-dtype level or column is built for it
+    ds = ds.drop_vars("decade_month")
+
     df = (
-        ds.stack(id_dim=(GEOMETRY_COLUMN, "decade_month"))
+        ds.stack(id_dim=(ID_COLUMN, "decade_month"))
         .to_dataframe()
-        .reset_index(drop=True)[[ID_COLUMN, "decade_month", GEOMETRY_COLUMN] + list(ds.data_vars)]
+        .reset_index(drop=True)[[ID_COLUMN] + list(ds.data_vars) + ["decade", "month"]]
     )
 
-    df["decade"] = df["decade_month"].apply(lambda x: int(x[0:4]))
-    df["month"] = df["decade_month"].apply(lambda x: int(x[-2:]))
-    df.drop(columns=["decade_month"], inplace=True)
+    # Ensemble statistics carry a few significant figures at most, float32 halves
+    # the frame size; values are widened and rounded again when loaded
+    value_columns = list(ds.data_vars)
+    df[value_columns] = df[value_columns].astype(np.float32)
 
     return df
 
 
+def empty_zonal_df(climate: xr.Dataset) -> pd.DataFrame:
+    """Empty DataFrame with the same columns as convert_ds_to_df(), returned
+    when a geometry subset has no features."""
+    return pd.DataFrame(columns=[ID_COLUMN] + list(climate.data_vars) + ["decade", "month"])
+
+
+def pack_geometries(geometry: gpd.GeoSeries) -> Tuple[bytes, np.ndarray, np.ndarray]:
+    """Packs a GeoSeries into one contiguous WKB buffer plus offsets.
+
+    Pickling a GeoSeries boxes every shapely geometry individually. A single
+    bytes buffer and two numpy arrays pickle as a handful of flat objects,
+    which is much cheaper to send to the process pool workers.
+
+    Args:
+        geometry (gpd.GeoSeries): Geometries indexed by feature id
+
+    Returns:
+        Tuple[bytes, np.ndarray, np.ndarray]: WKB buffer, offsets into the buffer, feature ids
+    """
+    wkb = shapely.to_wkb(geometry.values)
+    lengths = np.fromiter((len(g) for g in wkb), dtype=np.int64, count=len(wkb))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return b"".join(wkb), offsets, geometry.index.to_numpy()
+
+
+def unpack_geometries(
+    buffer: bytes, offsets: np.ndarray, ids: np.ndarray, crs
+) -> gpd.GeoSeries:
+    """Rebuilds the GeoSeries packed by pack_geometries()"""
+    wkb = [buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return gpd.GeoSeries(
+        shapely.from_wkb(wkb),
+        index=pd.Index(ids, name=ID_COLUMN),
+        crs=crs,
+    )
+
+
+def chunk_by_vertex_count(geometry: gpd.GeoSeries, n_chunks: int) -> List[gpd.GeoSeries]:
+    """Splits geometries into chunks with roughly equal total vertex counts.
+
+    exactextract cost scales with the number of vertices rather than the number
+    of features, so equal-length chunks can leave one worker with a few huge
+    polygons. Features are assigned largest first to the chunk with the fewest
+    vertices so far (longest processing time first scheduling).
+
+    Args:
+        geometry (gpd.GeoSeries): Geometries to split
+        n_chunks (int): Number of chunks
+
+    Returns:
+        List[gpd.GeoSeries]: Non-empty chunks of the input
+    """
+    n_coords = shapely.get_num_coordinates(geometry.values)
+    bins = [(0, i) for i in range(n_chunks)]
+    assignment = np.empty(len(geometry), dtype=np.int64)
+    for position in np.argsort(-n_coords, kind="stable"):
+        load, i = heapq.heappop(bins)
+        assignment[position] = i
+        heapq.heappush(bins, (load + int(n_coords[position]), i))
+
+    chunks = [geometry[assignment == i] for i in range(n_chunks)]
+    return [chunk for chunk in chunks if len(chunk)]
+
+
+def _init_climate_worker(
+    skeleton: xr.Dataset, variables: Dict[str, Tuple[Tuple[str, ...], str, Dict]]
+) -> None:
+    global _SHARED_CLIMATE
+    _SHARED_CLIMATE = skeleton.assign(
+        {
+            name: (dims, np.load(path, mmap_mode="r"), attrs)
+            for name, (dims, path, attrs) in variables.items()
+        }
+    )
+
+
+@contextlib.contextmanager
+def create_climate_pool(climate: xr.Dataset, max_workers: int):
+    """Creates a process pool whose workers hold the computed climate data.
+
+    Workers are spawned rather than forked. The parent has dask, GDAL and boto3
+    threads running (e.g. the background geotiff upload in pipeline.py), and a
+    forked child inherits any lock those threads hold at the moment of the fork.
+
+    Each data variable is written once to a private temp directory as .npy and
+    memory-mapped by every worker, so the pages are shared through the page
+    cache instead of being pickled into every task or copied per worker. Only
+    the coordinates and attributes go through the pool initializer. Tasks read
+    the Dataset through run_with_shared_climate().
+    """
+    with tempfile.TemporaryDirectory(prefix="climate-pool-") as climate_dir:
+        variables = {}
+        for i, (name, da) in enumerate(climate.data_vars.items()):
+            path = os.path.join(climate_dir, f"{i}.npy")
+            np.save(path, np.asarray(da.values))
+            variables[name] = (da.dims, path, da.attrs)
+
+        with cf.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_climate_worker,
+            initargs=(climate.drop_vars(list(climate.data_vars)), variables),
+        ) as executor:
+            yield executor
+
+
+def run_with_shared_climate(func, *args):
+    """Calls func(climate, *args) in a worker of create_climate_pool()"""
+    return func(_SHARED_CLIMATE, *args)
+
+
 def task_xvec_zonal_stats(
     climate: xr.Dataset,
-    geometry,
+    geometry: Tuple[bytes, np.ndarray, np.ndarray],
+    crs,
     x_dim,
     y_dim,
     zonal_agg_method,
@@ -69,12 +228,14 @@ def task_xvec_zonal_stats(
     checking attributes, it seems the CRS attribute strings showed the same CRS,
     but the string values were not identical. So ignoring the warning was okay.
 
+    Geometries arrive packed by pack_geometries() and are rebuilt here.
+
     Returns:
         pd.DataFrame: DataFrame in format of convert_da_to_df()
     """
 
     ds = climate.xvec.zonal_stats(
-        geometry,
+        unpack_geometries(*geometry, crs=crs),
         x_coords=x_dim,
         y_coords=y_dim,
         stats=zonal_agg_method,
@@ -94,6 +255,9 @@ def zonal_aggregation_point(
     y_dim: str,
 ) -> pd.DataFrame:
 
+    if infra.empty:
+        return empty_zonal_df(climate)
+
     ds = climate.xvec.extract_points(
         infra.geometry, x_coords=x_dim, y_coords=y_dim, index=True
     )
@@ -110,19 +274,23 @@ def zonal_aggregation_linestring(
 ) -> pd.DataFrame:
     """Linestring cannot be zonally aggreated, so must be broken into points"""
 
-    sampled_points = []
-    for idx, row in infra.iterrows():
-        line = row[GEOMETRY_COLUMN]  # type == shapely.LineString
-        points = list(line.coords)
-        sampled_points.extend([(idx, Point(point)) for point in points])
+    if infra.empty:
+        return empty_zonal_df(climate)
+
+    # Every vertex of every line becomes a sample point, tagged with the id of its line
+    coords, geom_idx = shapely.get_coordinates(infra.geometry.values, return_index=True)
 
-    if sampled_points:
+    if len(coords):
+        # Repeated vertices of the same line would otherwise be weighted twice
         df_sampled_points = pd.DataFrame(
-            sampled_points, columns=[ID_COLUMN, GEOMETRY_COLUMN]
-        )
+            {ID_COLUMN: infra.index.values[geom_idx], "x": coords[:, 0], "y": coords[:, 1]}
+        ).drop_duplicates()
         gdf_sampled_points = gpd.GeoDataFrame(
-            df_sampled_points, geometry=GEOMETRY_COLUMN, crs=infra.crs
-        ).set_index(ID_COLUMN)
+            {GEOMETRY_COLUMN: shapely.points(df_sampled_points[["x", "y"]].to_numpy())},
+            index=pd.Index(df_sampled_points[ID_COLUMN].to_numpy(), name=ID_COLUMN),
+            geometry=GEOMETRY_COLUMN,
+            crs=infra.crs,
+        )
         ds_linestring_points = climate.xvec.extract_points(
             gdf_sampled_points.geometry, x_coords=x_dim, y_coords=y_dim, index=True
         )
@@ -141,8 +309,7 @@ def zonal_aggregation_linestring(
         # as a single entity may now have multiple records of exposure, one for each line segment.
 
         df_linestring = (
-            df_linestring.drop_duplicates()
-            .groupby([ID_COLUMN, "decade", "month"])
+            df_linestring.groupby([ID_COLUMN, "decade", "month"], sort=False)
             .agg({"value_mean": "mean",
                   "value_median": "mean",
                   "value_stddev": "mean",
@@ -153,7 +320,7 @@ def zonal_aggregation_linestring(
             .reset_index()
         )
     else:
-        df_linestring = pd.DataFrame()
+        df_linestring = empty_zonal_df(climate)
     return df_linestring
 
 
@@ -163,21 +330,40 @@ def zonal_aggregation_polygon(
     x_dim: str,
     y_dim: str,
     zonal_agg_method: str,
+    executor: cf.ProcessPoolExecutor = None,
+    workers: int = None,
 ) -> pd.DataFrame:
+    """Zonal stats for polygon features, split into chunks across a process pool.
+
+    If an executor is passed, it must come from create_climate_pool() with the
+    same climate data. Otherwise a pool with one process per chunk is created.
+
+    exactextract is kept for the per-feature work: it weights pixels by their
+    exact coverage fraction, which a plain pixel-center aggregation would not
+    reproduce, and each task only applies the single zonal_agg_method.
+    """
+
+    if infra.empty:
+        return empty_zonal_df(climate)
 
-    climate_computed = climate.compute() # Parallel task did not work unless data was computed
     # The following parallelizes the zonal aggregation of polygon geometry features
-    workers = min(os.cpu_count(), len(infra.geometry))
+    workers = min(workers or os.cpu_count(), len(infra.geometry))
     futures = []
     results = []
-    geometry_chunks = np.array_split(infra.geometry, workers)
-    with cf.ProcessPoolExecutor(max_workers=workers) as executor:
+    geometry_chunks = chunk_by_vertex_count(infra.geometry, workers)
+    if executor is None:
+        # Parallel task did not work unless data was computed
+        pool = create_climate_pool(climate.compute(), max_workers=workers)
+    else:
+        pool = contextlib.nullcontext(executor)
+    with pool as executor:
         for i in range(len(geometry_chunks)):
             futures.append(
                 executor.submit(
+                    run_with_shared_climate,
                     task_xvec_zonal_stats,
-                    climate_computed,
-                    geometry_chunks[i],
+                    pack_geometries(geometry_chunks[i]),
+                    infra.crs,
                     x_dim,
                     y_dim,
                     zonal_agg_method,
@@ -185,8 +371,8 @@ def zonal_aggregation_polygon(
                     True,
                 )
             )
-        cf.as_completed(futures)
-        for future in futures:
+        # Collect chunks as they finish so results are unpickled while other chunks run
+        for future in cf.as_completed(futures):
             try:
                 results.append(future.result())
             except Exception as e:
@@ -194,17 +380,34 @@ def zonal_aggregation_polygon(
                     f"Future result in zonal agg process pool could not be appended: {str(e)}"
                 )
 
+    if not results:
+        return empty_zonal_df(climate)
+
     df_polygon = pd.concat(results)
     return df_polygon
 
 
-def zonal_aggregation(
+def raster_extent(climate: xr.Dataset, x_dim: str, y_dim: str) -> shapely.Polygon:
+    """Returns the outer edge of the climate grid as a box, pixel centers
+    extended by half a cell on each side."""
+    bounds = []
+    for dim in (x_dim, y_dim):
+        coords = climate[dim].values
+        half_cell = abs(coords[1] - coords[0]) / 2 if len(coords) > 1 else 0
+        bounds.append((coords.min() - half_cell, coords.max() + half_cell))
+    (min_x, max_x), (min_y, max_y) = bounds
+    return shapely.box(min_x, min_y, max_x, max_y)
+
+
+def zonal_aggregation_frames(
     climate: xr.Dataset,
     infra: gpd.GeoDataFrame,
     zonal_agg_method: str,
     x_dim: str,
     y_dim: str,
-) -> pd.DataFrame:
+    executor: cf.ProcessPoolExecutor = None,
+    max_workers: int = None,
+) -> List[pd.DataFrame]:
     """Performs zonal aggregation on climate data and infrastructure data.
 
     Data needs to be split up into point and non point geometries, as xvec
@@ -223,11 +426,21 @@ def zonal_aggregation(
         zonal_agg_method (str): Zonal aggregation method
         x_dim (str): X dimension name
         y_dim (str): Y dimension name
+        executor (cf.ProcessPoolExecutor): Pool from create_climate_pool() with the
+            same climate data. A pool is created for the call if not passed.
+        max_workers (int): Size of the process pool, os.cpu_count() by default
 
     Returns:
-        pd.DataFrame: Aggregated data
+        List[pd.DataFrame]: Aggregated data, one frame per non-empty geometry subset
     """
 
+    # Features entirely outside the raster can only produce NaNs, so they are
+    # dropped before any geometry is sampled or sent to exactextract
+    outside = ~shapely.intersects(infra.geometry.values, raster_extent(climate, x_dim, y_dim))
+    if outside.any():
+        logger.info(f"{int(outside.sum())} features are outside the climate raster extent")
+        infra = infra.loc[~outside]
+
     point_geom_types = ["Point", "MultiPoint"]
     line_geom_types = ["LineString", "MultiLineString"]
     polygon_geom_types = ["Polygon", "MultiPolygon"]
@@ -236,48 +449,73 @@ def zonal_aggregation(
     polygon_infra = infra.loc[infra.geom_type.isin(polygon_geom_types)]
     point_infra = infra.loc[infra.geom_type.isin(point_geom_types)]
 
-    df_point = zonal_aggregation_point(
-        climate=climate,
-        infra=point_infra,
-        x_dim=x_dim,
-        y_dim=y_dim
-    )
-    logger.info("Point geometries intersected successfully")
+    # Points and lines run in the same pool as the polygon chunks, so their
+    # extract_points calls overlap with the much slower exactextract pass.
+    climate_computed = climate.compute()
+    max_workers = max_workers or os.cpu_count()
+    if executor is None:
+        pool = create_climate_pool(climate_computed, max_workers=max_workers)
+    else:
+        pool = contextlib.nullcontext(executor)
+    with pool as executor:
+        point_future = executor.submit(
+            run_with_shared_climate, zonal_aggregation_point, point_infra, x_dim, y_dim
+        )
+        linestring_future = executor.submit(
+            run_with_shared_climate, zonal_aggregation_linestring, line_infra, x_dim, y_dim
+        )
 
-    df_linestring = zonal_aggregation_linestring(
-        climate=climate,
-        infra=line_infra,
-        x_dim=x_dim,
-        y_dim=y_dim,
-    )
+        df_polygon = zonal_aggregation_polygon(
+            climate=climate_computed,
+            infra=polygon_infra,
+            x_dim=x_dim,
+            y_dim=y_dim,
+            zonal_agg_method=zonal_agg_method,
+            executor=executor,
+            workers=max(max_workers - 2, 1),
+        )
+        logger.info("Polygon geometries intersected successfully")
 
-    logger.info("Lines geometries intersected successfully")
+        df_point = point_future.result()
+        logger.info("Point geometries intersected successfully")
 
-    df_polygon = zonal_aggregation_polygon(
-        climate=climate,
-        infra=polygon_infra,
-        x_dim=x_dim,
-        y_dim=y_dim,
-        zonal_agg_method=zonal_agg_method,
-    )
+        df_linestring = linestring_future.result()
+        logger.info("Lines geometries intersected successfully")
 
-    logger.info("Polygon geometries intersected successfully")
+    # Each subset is returned as its own frame, so callers that stream the rows
+    # to Postgres never need a combined copy of the full output
+    return [df for df in (df_point, df_linestring, df_polygon) if not df.empty]
 
-    # Applies the same method for converting from DataArray to DataFrame, and
-    # combines the data back together.
-    df = pd.concat(
-        [df_point, df_linestring, df_polygon],
-        ignore_index=True,
-    )
 
-    if GEOMETRY_COLUMN in df.columns:
-        df.drop(GEOMETRY_COLUMN, inplace=True, axis=1)
+def zonal_aggregation(
+    climate: xr.Dataset,
+    infra: gpd.GeoDataFrame,
+    zonal_agg_method: str,
+    x_dim: str,
+    y_dim: str,
+) -> pd.DataFrame:
+    """Same as zonal_aggregation_frames(), with the point, line, and polygon
+    results combined into a single DataFrame.
 
-    return df
+    Returns:
+        pd.DataFrame: Aggregated data
+    """
+    frames = zonal_aggregation_frames(
+        climate=climate,
+        infra=infra,
+        zonal_agg_method=zonal_agg_method,
+        x_dim=x_dim,
+        y_dim=y_dim,
+    )
+    # Empty subsets are already left out, since pandas would otherwise upcast
+    # the columns to object
+    if not frames:
+        return empty_zonal_df(climate)
+    return pd.concat(frames, ignore_index=True)
 
 
 def create_pgosm_flex_query(
-    osm_tables: List[str], osm_type: str, crs: str
+    osm_tables: List[str], osm_type: str, crs: str, sample_size: int | None = None
 ) -> Tuple[sql.SQL, Tuple[str]]:
     """Creates SQL query to get all features of a given type from PG OSM Flex Schema
 
@@ -285,18 +523,23 @@ def create_pgosm_flex_query(
 
     Example:
 
-    SELECT osm_id AS id, ST_AsText(ST_Transform(geom, 4326)) AS geometry
+    SELECT osm_id AS id, ST_AsBinary(ST_Transform(geom, 4326)) AS geometry
         FROM osm.infrastructure_polygon
     WHERE osm_type = 'power'
     UNION ALL
-    SELECT osm_id AS id, ST_AsText(ST_Transform(geom, 4326)) AS geometry
+    SELECT osm_id AS id, ST_AsBinary(ST_Transform(geom, 4326)) AS geometry
         FROM osm.infrastructure_point
     WHERE osm_type = 'power'
 
+    If sample_size is set, the union is wrapped in
+    SELECT * FROM (...) u ORDER BY random() LIMIT sample_size, so only a random
+    subset of features is returned. Intended for debugging.
+
 
     Args:
         osm_category (str): OpenStreetMap Category (Will be the prefix of the tables names)
         osm_type (str): OpenStreetMap feature type
+        sample_size (int | None): Number of randomly sampled features to return, all if None
 
     Returns:
         Tuple[sql.SQL, Tuple[str]]: Query in SQL object and params of given query
@@ -307,7 +550,7 @@ def create_pgosm_flex_query(
 
     for table in osm_tables:
         sub_query = sql.SQL(
-            "SELECT main.osm_id AS {id}, ST_AsText(ST_Transform(main.geom, %s)) AS {geometry} FROM {schema}.{table} main WHERE osm_type = %s"
+            "SELECT main.osm_id AS {id}, ST_AsBinary(ST_Transform(main.geom, %s)) AS {geometry} FROM {schema}.{table} main WHERE osm_type = %s"
         ).format(
             schema=sql.Identifier(schema),
             table=sql.Identifier(table),
@@ -318,50 +561,245 @@ def create_pgosm_flex_query(
         union_queries.append(sub_query)
     query = sql.SQL(" UNION ALL ").join(union_queries)
 
+    if sample_size is not None:
+        query = sql.SQL("SELECT * FROM ({union}) u ORDER BY random() LIMIT %s").format(
+            union=query
+        )
+        params.append(int(sample_size))
+
     return query, tuple(params)
 
 
-def main(
-    climate_ds: xr.Dataset,
+def get_osm_tables(osm_category: str, conn: pg.extensions.connection) -> List[str]:
+    """Returns the PG OSM Flex tables for a category, querying the database
+    only the first time a category is requested for a given DSN."""
+    key = (osm_category, conn.dsn)
+    if key not in _OSM_TABLES_CACHE:
+        _OSM_TABLES_CACHE[key] = utils.get_osm_category_tables(
+            osm_category=osm_category, conn=conn
+        )
+    return _OSM_TABLES_CACHE[key]
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_pgosm_flex_query(
+    osm_tables: Tuple[str], osm_type: str, crs: int, sample_size: int | None
+) -> Tuple[sql.SQL, Tuple[str]]:
+    return create_pgosm_flex_query(
+        osm_tables=list(osm_tables), osm_type=osm_type, crs=crs, sample_size=sample_size
+    )
+
+
+def get_osm_snapshot(
+    osm_tables: List[str], conn: pg.extensions.connection
+) -> str | None:
+    """Returns the state of the queried OSM relations, used to invalidate the
+    cached infrastructure data when any of them changes.
+
+    The latest PG OSM Flex import alone misses relations that are rewritten
+    without a new import, so each table or view also contributes:
+    - its oid and relfilenode, which change when it is recreated, truncated or
+      (non-concurrently) refreshed
+    - its insert/update/delete counters, which change on in-place writes and
+      concurrent refreshes
+    - a hash of its definition, for views and materialized views
+
+    Returns None if no import is recorded, the state can't be identified then.
+    """
+    query = sql.SQL(
+        """
+        SELECT
+            (SELECT max(imported)::text FROM osm.pgosm_flex),
+            string_agg(
+                concat_ws(
+                    ':', c.relname, c.oid, c.relfilenode,
+                    s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+                    CASE WHEN c.relkind IN ('v', 'm') THEN md5(pg_get_viewdef(c.oid)) END
+                ),
+                ',' ORDER BY c.relname
+            )
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE n.nspname = 'osm' AND c.relname = ANY(%s)
+        """
+    )
+    imported, relations = utils.query_db(
+        query=query, conn=conn, params=(list(osm_tables),)
+    )[0]
+    if imported is None:
+        return None
+    return f"{imported}|{relations}"
+
+
+def query_infra(
     osm_category: str,
     osm_type: str,
     crs: str,
-    zonal_agg_method: List[str] | str,
     conn: pg.extensions.connection,
-    metadata: Dict,  # Add metadata parameter
-) -> pd.DataFrame:
+    sample_size: int | None = None,
+) -> gpd.GeoDataFrame:
+    """Queries OSM features from PG OSM Flex into a GeoDataFrame indexed by osm_id"""
 
-    osm_tables = utils.get_osm_category_tables(osm_category=osm_category, conn=conn)
+    osm_tables = get_osm_tables(osm_category=osm_category, conn=conn)
 
-    query, params = create_pgosm_flex_query(
-        osm_tables=osm_tables, osm_type=osm_type, crs=crs
+    query, params = _cached_pgosm_flex_query(
+        osm_tables=tuple(osm_tables),
+        osm_type=osm_type,
+        crs=int(crs),
+        sample_size=sample_size,
     )
     infra_data = utils.query_db(query=query, params=params, conn=conn)
     logger.info("OSM features queried successfully")
 
-    infra_df = pd.DataFrame(infra_data, columns=[ID_COLUMN, GEOMETRY_COLUMN]).set_index(
-        ID_COLUMN
+    # Geometries come back as WKB and are parsed in a single vectorized call
+    osm_ids, geometries = zip(*infra_data) if infra_data else ((), ())
+    infra_gdf = gpd.GeoDataFrame(
+        {GEOMETRY_COLUMN: shapely.from_wkb([bytes(g) for g in geometries])},
+        index=pd.Index(osm_ids, name=ID_COLUMN, dtype=np.int64),
+        geometry=GEOMETRY_COLUMN,
+        crs=crs,
+    )
+    return infra_gdf
+
+
+def infra_cache_dir() -> Path | None:
+    """Returns INFRA_CACHE_DIR, creating it private to the current user
+
+    Returns None, so the cache is not used, if the directory is a symlink, is
+    owned by another user, or is writable by anyone else. Another user could
+    otherwise plant or alter cache files that this pipeline reads.
+    """
+    try:
+        INFRA_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = os.lstat(INFRA_CACHE_DIR)
+    except OSError as e:
+        logger.warning(f"OSM feature cache disabled, {INFRA_CACHE_DIR}: {e}")
+        return None
+
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    ):
+        logger.warning(
+            f"OSM feature cache disabled, {INFRA_CACHE_DIR} is not a directory "
+            "private to the current user"
+        )
+        return None
+    return INFRA_CACHE_DIR
+
+
+def evict_infra_cache(cache_dir: Path) -> None:
+    """Deletes cache files older than INFRA_CACHE_MAX_AGE_SECONDS"""
+    cutoff = time.time() - INFRA_CACHE_MAX_AGE_SECONDS
+    for path in cache_dir.glob("*.npz"):
+        with contextlib.suppress(FileNotFoundError):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+
+
+def write_infra_cache(infra_gdf: gpd.GeoDataFrame, cache_path: Path) -> None:
+    """Writes the features as WKB plus offsets arrays, see pack_geometries()
+
+    Written under a unique name and moved into place, so concurrent runs never
+    read a partially written file.
+    """
+    buffer, offsets, ids = pack_geometries(infra_gdf.geometry)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, wkb=np.frombuffer(buffer, dtype=np.uint8), offsets=offsets, ids=ids)
+    os.replace(tmp_path, cache_path)
+
+
+def read_infra_cache(cache_path: Path, crs) -> gpd.GeoDataFrame:
+    """Reads the features written by write_infra_cache()"""
+    # Plain numeric arrays only, np.load refuses pickled objects by default
+    with np.load(cache_path, allow_pickle=False) as data:
+        geometry = unpack_geometries(
+            data["wkb"].tobytes(), data["offsets"], data["ids"], crs=crs
+        )
+    return gpd.GeoDataFrame(
+        {GEOMETRY_COLUMN: geometry}, geometry=GEOMETRY_COLUMN, crs=crs
+    )
+
+
+def load_infra(
+    osm_category: str,
+    osm_type: str,
+    crs: str,
+    conn: pg.extensions.connection,
+    sample_size: int | None = None,
+) -> gpd.GeoDataFrame:
+    """Returns the infrastructure GeoDataFrame, reading it from INFRA_CACHE_DIR
+    when the same features were already queried and the OSM relations have not
+    changed since (see get_osm_snapshot).
+
+    Sampled queries are random, so they always go to the database.
+    """
+    if sample_size is not None:
+        return query_infra(osm_category, osm_type, crs, conn, sample_size)
+
+    cache_dir = infra_cache_dir()
+    if cache_dir is None:
+        return query_infra(osm_category, osm_type, crs, conn)
+
+    snapshot = get_osm_snapshot(get_osm_tables(osm_category, conn), conn)
+    if snapshot is None:
+        logger.warning("No PG OSM Flex import recorded, OSM features are not cached")
+        return query_infra(osm_category, osm_type, crs, conn)
+
+    key = f"{osm_category}|{osm_type}|{int(crs)}|{snapshot}"
+    cache_path = cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.npz"
+
+    if cache_path.exists():
+        logger.info(f"OSM features loaded from cache {cache_path}")
+        return read_infra_cache(cache_path, crs=crs)
+
+    evict_infra_cache(cache_dir)
+    infra_gdf = query_infra(osm_category, osm_type, crs, conn)
+    write_infra_cache(infra_gdf, cache_path)
+    return infra_gdf
+
+
+def main(
+    climate_ds: xr.Dataset,
+    osm_category: str,
+    osm_type: str,
+    crs: str,
+    zonal_agg_method: List[str] | str,
+    conn: pg.extensions.connection,
+    sample_size: int | None = None,
+    executor: cf.ProcessPoolExecutor = None,
+    max_workers: int = None,
+) -> List[pd.DataFrame]:
+
+    infra_gdf = load_infra(
+        osm_category=osm_category,
+        osm_type=osm_type,
+        crs=crs,
+        conn=conn,
+        sample_size=sample_size,
     )
-    infra_df[GEOMETRY_COLUMN] = infra_df[GEOMETRY_COLUMN].apply(wkt.loads)
-    infra_gdf = gpd.GeoDataFrame(infra_df, geometry=GEOMETRY_COLUMN, crs=crs)
 
     logger.info("Starting Zonal Aggregation...")
-    df = zonal_aggregation(
+    frames = zonal_aggregation_frames(
         climate=climate_ds,
         infra=infra_gdf,
         zonal_agg_method=zonal_agg_method,
         x_dim=constants.X_DIM,
-        y_dim=constants.Y_DIM
+        y_dim=constants.Y_DIM,
+        executor=executor,
+        max_workers=max_workers,
     )
     logger.info("Zonal Aggregation Computed")
 
-    failed_aggregations = df.loc[df["value_mean"].isna(), ID_COLUMN].nunique()
+    # Geometry subsets are disjoint, so failed ids can be counted per frame
+    failed_aggregations = sum(
+        df.loc[df["value_mean"].isna(), ID_COLUMN].nunique() for df in frames
+    )
     logger.warning(
         f"{str(failed_aggregations)} osm_ids were unable to be zonally aggregated"
     )
-    df = df.dropna()
-    
-    # Before returning the DataFrame, add the metadata column
-    df['metadata'] = json.dumps(metadata)
-    
-    return df
+
+    return [df.dropna() for df in frames]
@@ -1,14 +1,16 @@
-import io
 import json
 import logging
 import time
 import random
-from typing import Dict
+from typing import Dict, List
 
+import numpy as np
 import pandas as pd
 import psycopg2 as pg
 from psycopg2 import sql
 
+import utils
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
@@ -26,71 +28,83 @@ TEMP_TABLE_COLUMNS = [
     "value_max",
     "value_q1",
     "value_q3",
-    "metadata",
 ]
 
+# Binary COPY does not cast, so frame dtypes have to line up with the temp table
+# columns exactly (BIGINT, SMALLINT and DOUBLE PRECISION)
+TEMP_TABLE_DTYPES = {
+    "osm_id": np.int64,
+    "month": np.int16,
+    "decade": np.int16,
+    "ssp": np.int16,
+}
+VALUE_COLUMNS = [column for column in TEMP_TABLE_COLUMNS if column.startswith("value_")]
+
+# Ensemble statistics are stored with this many significant digits. Values are
+# carried as float32 up to here; widening float32 directly would store its
+# noise (0.3 as 0.30000001192092896), rounding stores 0.3.
+VALUE_SIGNIFICANT_DIGITS = 5
+
 def generate_random_table_id():
     timestamp = int(time.time())  # Milliseconds since epoch
     random_part = random.randint(1000, 9999)  # Random 4-digit number
     return f"{timestamp}{random_part}"
 
 def main(
-    df: pd.DataFrame,
+    df: pd.DataFrame | List[pd.DataFrame],
     ssp: int,
     climate_variable: str,
     conn: pg.extensions.connection,
     metadata: Dict,
 ):
 
-    # Adds columns needed for temp table
-    df["ssp"] = ssp
+    # Adds columns needed for temp table. A list of frames, as returned by
+    # infra_intersection.main, is streamed to COPY without being concatenated.
+    frames = [df] if isinstance(df, pd.DataFrame) else df
+    for frame in frames:
+        frame["ssp"] = ssp
+        for column, dtype in TEMP_TABLE_DTYPES.items():
+            if frame[column].dtype != dtype:
+                frame[column] = frame[column].astype(dtype)
+        for column in VALUE_COLUMNS:
+            frame[column] = utils.round_significant(
+                frame[column].to_numpy(), VALUE_SIGNIFICANT_DIGITS
+            )
     data_load_table = f"nasa_nex_{climate_variable}"
 
     # Random ID needed if multiple laod process running at once
     random_table_id = generate_random_table_id()
     temp_table_name = f"nasa_nex_temp_{random_table_id}"
 
-    # Reads data into memory
-    sio = io.StringIO()
-    sio.write(df[TEMP_TABLE_COLUMNS].to_csv(index=False, header=False))
-    sio.seek(0)
-
     create_nasa_nex_temp_table = sql.SQL(
     """
     CREATE TEMP TABLE {temp_table} (
         osm_id BIGINT,
-        month INT,
-        decade INT,
-        ssp int,
-        value_mean FLOAT NOT NULL,
-        value_median FLOAT NOT NULL,
-        value_stddev FLOAT NOT NULL,
-        value_min FLOAT NOT NULL,
-        value_max FLOAT NOT NULL,
-        value_q1 FLOAT NOT NULL,
-        value_q3 FLOAT NOT NULL,
-        metadata JSONB
-    );
+        month SMALLINT,
+        decade SMALLINT,
+        ssp SMALLINT,
+        value_mean DOUBLE PRECISION NOT NULL,
+        value_median DOUBLE PRECISION NOT NULL,
+        value_stddev DOUBLE PRECISION NOT NULL,
+        value_min DOUBLE PRECISION NOT NULL,
+        value_max DOUBLE PRECISION NOT NULL,
+        value_q1 DOUBLE PRECISION NOT NULL,
+        value_q3 DOUBLE PRECISION NOT NULL
+    ) ON COMMIT DROP;
     """
     ).format(temp_table=sql.Identifier(temp_table_name))
 
     copy_nasa_nex_temp = sql.SQL(
     """
     COPY {temp_table}
-    FROM STDIN WITH (FORMAT csv, HEADER false, DELIMITER ',')
-    """
-    ).format(temp_table=sql.Identifier(temp_table_name))
-
-    drop_nasa_nex_temp = sql.SQL(
-    """
-    DROP TABLE {temp_table};
+    FROM STDIN WITH (FORMAT binary)
     """
     ).format(temp_table=sql.Identifier(temp_table_name))
 
     insert_nasa_nex = sql.SQL(
     """
     INSERT INTO {climate_schema}.{table} (osm_id, month, decade, ssp, value_mean, value_median, value_stddev, value_min, value_max, value_q1, value_q3, metadata)
-            SELECT temp.osm_id, temp.month, temp.decade, temp.ssp, temp.value_mean, temp.value_median, temp.value_stddev, temp.value_min, temp.value_max, temp.value_q1, temp.value_q3, temp.metadata 
+            SELECT temp.osm_id, temp.month, temp.decade, temp.ssp, temp.value_mean, temp.value_median, temp.value_stddev, temp.value_min, temp.value_max, temp.value_q1, temp.value_q3, %s::jsonb
             FROM {temp_table} temp
     ON CONFLICT DO NOTHING
     """
@@ -100,17 +114,20 @@ def main(
         climate_schema=sql.Identifier(CLIMATE_SCHEMA),
     )
 
-    # Executes database commands
+    # Executes database commands. This is three round trips inside one transaction:
+    # COPY has to be its own statement, and the temp table is dropped by the commit.
     with conn.cursor() as cur:
 
         cur.execute(create_nasa_nex_temp_table)
-        cur.copy_expert(copy_nasa_nex_temp, sio)
+        # Rows are encoded in chunks as COPY consumes them
+        utils.copy_df_db(
+            query=copy_nasa_nex_temp, df=frames, conn=conn, columns=TEMP_TABLE_COLUMNS
+        )
         logger.info(f"{climate_variable} Temp Table Loaded")
 
-        cur.execute(insert_nasa_nex)
+        # Metadata is the same for every row, so it is sent once as a parameter
+        cur.execute(insert_nasa_nex, (json.dumps(metadata),))
         logger.info(f"{climate_variable} Table Loaded")
 
-        # Cleanup for next pipeline run
-        cur.execute(drop_nasa_nex_temp)
-
+    # The temp table is dropped by the commit (ON COMMIT DROP)
     conn.commit()
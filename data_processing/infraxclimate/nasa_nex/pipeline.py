@@ -1,8 +1,10 @@
 import argparse
+import concurrent.futures as cf
 import logging
 import os
 import tempfile
 
+import dask
 from psycopg2 import pool
 
 import generate_geotiff
@@ -17,6 +19,7 @@ logging.basicConfig(level=logging.INFO)
 
 
 LOAD_GEOTIFFS = True # For debugging, loading geotiffs takes time and 
+INFRA_SAMPLE_SIZE = None # For debugging, set to an int to only query a random sample of OSM features
 
 PG_DBNAME = os.environ["PG_DBNAME"]
 PG_USER = os.environ["PG_USER"]
@@ -25,6 +28,22 @@ PG_HOST = os.environ["PG_HOST"]
 PG_PORT = os.environ["PG_PORT"]
 
 
+def create_geotiffs(
+    ds, output_dir: str, state: str, metadata: dict, s3_bucket: str, s3_prefix: str
+):
+    """Writes the climate COGs to output_dir and uploads them to S3"""
+    generate_geotiff.main(
+        ds=ds,
+        output_dir=output_dir,
+        state=state,
+        metadata=metadata,
+    )
+    logger.info("Geotiffs created")
+
+    utils.upload_files(s3_bucket=s3_bucket, s3_prefix=s3_prefix, dir=output_dir)
+    logger.info("Geotiffs uploaded")
+
+
 def main(
     ssp: str,
     s3_bucket: str,
@@ -36,8 +55,16 @@ def main(
     state_bbox: str,
     osm_category: str,
     osm_type: str,
+    max_workers: int = None,
 ):
-    """Runs a processing pipeline for a given zarr store"""
+    """Runs a processing pipeline for a given zarr store
+
+    max_workers caps both the dask scheduler and the zonal process pool, it
+    defaults to the CPU count. run.py passes a share of the CPUs when SSPs run
+    side by side.
+    """
+
+    max_workers = max_workers or os.cpu_count()
 
     # Create connection pool with passed parameters
     connection_pool = pool.SimpleConnectionPool(
@@ -61,6 +88,12 @@ def main(
         bbox=bbox
     )
 
+    # The dataset is still a lazy dask graph at this point. Materialize the ensemble
+    # reduction once, into memory, so the geotiff writes and the infra intersection
+    # share one copy instead of each recomputing it from the raw zarr stores.
+    with dask.config.set(num_workers=max_workers):
+        ds = ds.compute()
+
     logger.info("Climate Data Processed")
 
     metadata = utils.create_metadata(
@@ -69,17 +102,24 @@ def main(
 
     metadata[constants.METADATA_KEY]["zonal_agg_method"] = zonal_agg_method
 
-    with tempfile.TemporaryDirectory() as geotiff_tmpdir:
+    # The zonal pool is created before the geotiff thread starts. Its workers are
+    # spawned (fork + exec, see create_climate_pool), never forked copies of this
+    # process, so they don't inherit the state of the geotiff, dask or boto3 threads.
+    with infra_intersection.create_climate_pool(
+        ds, max_workers=max_workers
+    ) as zonal_executor, tempfile.TemporaryDirectory() as geotiff_tmpdir, cf.ThreadPoolExecutor(
+        max_workers=1
+    ) as executor:
+        # COG writes and S3 uploads are mostly I/O, so they run in a background thread
+        # while the zonal aggregation keeps the process pool busy
+        geotiff_future = None
         if LOAD_GEOTIFFS:
-            generate_geotiff.main(
+            geotiff_future = executor.submit(
+                create_geotiffs,
                 ds=ds,
                 output_dir=geotiff_tmpdir,
                 state=state_bbox,
                 metadata=metadata,
-            )
-            logger.info("Geotiffs created")
-
-            utils.upload_files(
                 s3_bucket=s3_bucket,
                 s3_prefix=utils.create_s3_prefix(
                     s3_prefix_geotiff,
@@ -87,26 +127,30 @@ def main(
                     ssp,
                     "cogs",
                 ),
-                dir=geotiff_tmpdir,
             )
-            logger.info("Geotiffs uploaded")
 
         infra_intersection_conn = connection_pool.getconn()
-        df = infra_intersection.main(
+        dfs = infra_intersection.main(
             climate_ds=ds,
             osm_category=osm_category,
             osm_type=osm_type,
             crs=crs,
             zonal_agg_method=zonal_agg_method,
             conn=infra_intersection_conn,
-            metadata=metadata  # Add metadata parameter
+            sample_size=INFRA_SAMPLE_SIZE,
+            executor=zonal_executor,
+            max_workers=max_workers,
         )
         connection_pool.putconn(infra_intersection_conn)
         logger.info("Infrastructure Intersection Complete")
 
+        # generate_geotiff adds the value range to metadata, which the load below stores
+        if geotiff_future is not None:
+            geotiff_future.result()
+
         infra_intersection_load_conn = connection_pool.getconn()
         infra_intersection_load.main(
-            df=df,
+            df=dfs,
             ssp=int(ssp),
             climate_variable=climate_variable,
             conn=infra_intersection_load_conn,
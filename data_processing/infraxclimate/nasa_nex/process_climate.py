@@ -1,7 +1,10 @@
+import concurrent.futures as cf
+import functools
 import logging
 from pathlib import Path
 import re
 
+import numpy as np
 import rioxarray
 import xarray as xr
 import fsspec
@@ -17,6 +20,9 @@ logger = logging.getLogger(__name__)
 HISTORICAL_YEARS = set(range(1950, 2015))  # 1950-2014
 FUTURE_YEARS = set(range(2015, 2101))  # 2015-2100
 
+# Number of models validated and opened concurrently in load_data
+MODEL_LOAD_WORKERS = 8
+
 
 def validate_model_ssp(fs: s3fs.S3FileSystem, model_path: str, ssp: str) -> bool:
     """Check if model has required SSP"""
@@ -57,30 +63,78 @@ def decade_month_calc(ds: xr.Dataset, time_dim: str = "time") -> xr.Dataset:
     within each decade.
 
     The function performs the following steps:
-    1. Assigns new coordinates to the dataset:
-       - `decade`: Represents the decade (e.g., 2050 for the 2050s).
-       - `month`: Represents the month (1 for January, 2 for February, etc.).
-    2. Creates a combined `decade_month` coordinate, formatted as "YYYY-MM",
+    1. Computes an integer key `decade * 100 + month` for each timestep
+       (e.g. 205001 for January of the 2050s).
+    2. Groups the dataset by that key and takes the mean with flox's "flox"
+       engine. Timesteps are in order, so each group is a contiguous run and
+       the mean is a single reduceat pass rather than a scatter-add. The
+       "cohorts" method reduces each month with only the time chunks that
+       contain it, so the dask graph stays small as the chunk count grows.
+    3. Relabels the groups as a `decade_month` coordinate formatted as "YYYY-MM",
        where "YYYY" is the starting year of the decade, and "MM" is the month.
-    3. Groups the dataset by the `decade_mon
     """
-    ds = ds.assign_coords(
-        decade=(ds["time.year"] // 10) * 10, month=ds["time"].dt.month
+    year = ds[time_dim].dt.year.values
+    month = ds[time_dim].dt.month.values
+    key = ((year // 10) * 10 * 100 + month).astype(np.int64)
+
+    ds = ds.assign_coords(decade_month=(time_dim, key))
+    ds = ds.groupby("decade_month").mean(engine="flox", method="cohorts")
+
+    # Labels are built once per group rather than once per timestep
+    keys = ds["decade_month"].values
+    labels = np.char.add(
+        np.char.add((keys // 100).astype(str), "-"),
+        np.char.zfill((keys % 100).astype(str), 2),
     )
+    ds = ds.assign_coords(decade_month=labels.astype(object))
+
+    return ds
 
-    ds = ds.assign_coords(
-        decade_month=(
-            time_dim,
-            [
-                f"{decade}-{month:02d}"
-                for decade, month in zip(ds["decade"].values, ds["month"].values)
-            ],
+
+def convert_lon(ds: xr.Dataset) -> xr.Dataset:
+    """Converts longitudes from 0-360 to -180-180, in ascending order.
+
+    For an ascending 0-360 grid the conversion is a rotation: the cells at or
+    above 180 move to the front. That is done with a roll, which avoids the
+    general sort. Any other layout falls back to the modulo and sortby.
+    """
+    lon = ds[constants.X_DIM].values
+    if np.any(lon >= 180) and np.all(np.diff(lon) > 0):
+        split = int(np.argmax(lon >= 180))
+        ds = ds.roll({constants.X_DIM: -split}, roll_coords=False)
+        return ds.assign_coords(
+            {constants.X_DIM: np.concatenate([lon[split:] - 360, lon[:split]])}
         )
-    )
 
-    ds = ds.groupby("decade_month").mean()
+    ds = ds.assign_coords({constants.X_DIM: (((ds[constants.X_DIM] + 180) % 360) - 180)})
+    return ds.sortby(constants.X_DIM)
 
-    return ds
+
+def preprocess_store(ds: xr.Dataset, bbox: dict | None = None) -> xr.Dataset:
+    """Preprocesses a single Zarr store before open_mfdataset combines them.
+
+    Longitudes are converted from 0-360 to -180-180 and the dataset is clipped
+    to the bbox before decade_month_calc, so the groupby only reads the cells
+    that are kept instead of the whole global grid.
+
+    Args:
+        ds (xr.Dataset): Dataset of a single Zarr store
+        bbox (dict): Dict with keys (min_lon, min_lat, max_lon, max_lat) in -180-180 lon
+
+    Returns:
+        xr.Dataset: Clipped decade-month climatology of the store
+    """
+    ds = convert_lon(ds)
+
+    if bbox:
+        ds = ds.sel(
+            {
+                constants.Y_DIM: slice(bbox["min_lat"], bbox["max_lat"]),
+                constants.X_DIM: slice(bbox["min_lon"], bbox["max_lon"]),
+            },
+        )
+
+    return decade_month_calc(ds)
 
 
 def reduce_model_stats(da: xr.DataArray) -> xr.Dataset:
@@ -123,6 +177,69 @@ def reduce_model_stats(da: xr.DataArray) -> xr.Dataset:
     return stats_ds
 
 
+def load_model(
+    fs: s3fs.S3FileSystem,
+    model_path: str,
+    ssp: str,
+    climate_variable: str,
+    bbox: dict,
+) -> xr.DataArray | None:
+    """Validates and lazily opens the Zarr stores of a single model.
+
+    Returns None if the model is missing the SSP or any required years.
+    """
+    model_name = model_path.rstrip("/").split("/")[-1]
+    logger.info(f"Validating model: {model_name}")
+
+    # Check if model has all required SSPs
+    if not validate_model_ssp(fs, model_path, ssp):
+        logger.warning(f"Skipping {model_name}: missing required SSP")
+        return None
+
+    # Get all zarr stores for this model and SSP
+    if ssp == '-999':
+        model_pattern = f"{model_path}/historical/*/{climate_variable}_day_*.zarr"
+    else:
+        model_pattern = f"{model_path}/ssp{ssp}/*/{climate_variable}_day_*.zarr"
+
+    zarr_stores = fs.glob(model_pattern)
+
+    # Check if model has all required years
+    if not validate_model_years(fs, zarr_stores):
+        logger.warning(f"Skipping {model_name}: missing required years")
+        return None
+
+    # Convert to full S3 URIs
+    zarr_uris = [f"s3://{path}" for path in zarr_stores]
+
+    logger.info(f"Loading validated model: {model_name}")
+    _ds = xr.open_mfdataset(
+        zarr_uris,
+        engine="zarr",
+        # Time is reduced away in preprocess, so it is chunked in multiples of
+        # the stored Zarr chunks to cut the task count. Spatial dims keep the
+        # stored chunk size so the bbox clip doesn't read extra chunks.
+        chunks={constants.TIME_DIM: "auto"},
+        combine="by_coords",
+        # Yearly stores of a model share coordinates and attributes, so take
+        # them from the first store instead of loading and comparing them all
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        combine_attrs="override",
+        parallel=True,
+        # Bbox currently only in -180-180 lon
+        # TODO: Add better error and case handling
+        preprocess=functools.partial(preprocess_store, bbox=bbox),
+    )
+    _da = _ds[climate_variable]
+    _da = _da.assign_coords(model=model_name)
+    _da = _da.expand_dims("model")
+
+    logger.info(f"{model_name} loaded")
+    return _da
+
+
 def load_data(
     s3_bucket: str,
     s3_prefix: str,
@@ -130,66 +247,29 @@ def load_data(
     climate_variable: str,
     bbox: dict,
 ) -> xr.DataArray:
-    """Reads all valid Zarr stores in the given S3 directory"""
-    data = []
+    """Reads all valid Zarr stores in the given S3 directory
 
+    Models are validated and opened on a thread pool. Both steps are dominated
+    by S3 listing and Zarr metadata requests, so opening the models concurrently
+    overlaps that latency instead of paying it once per model in sequence.
+    """
     fs = s3fs.S3FileSystem()
     pattern = f"s3://{s3_bucket}/{s3_prefix}/*"
     model_paths = fs.glob(pattern)
 
-
-    for model_path in model_paths:
-        model_name = model_path.rstrip("/").split("/")[-1]
-        logger.info(f"Validating model: {model_name}")
-
-        # Check if model has all required SSPs
-        if not validate_model_ssp(fs, model_path, ssp):
-            logger.warning(f"Skipping {model_name}: missing required SSP")
-            continue
-
-        # Get all zarr stores for this model and SSP
-        if ssp == '-999':
-            model_pattern = f"{model_path}/historical/*/{climate_variable}_day_*.zarr"
-        else:
-            model_pattern = f"{model_path}/ssp{ssp}/*/{climate_variable}_day_*.zarr"
-
-        zarr_stores = fs.glob(model_pattern)
-
-        # Check if model has all required years
-        if not validate_model_years(fs, zarr_stores):
-            logger.warning(f"Skipping {model_name}: missing required years")
-            continue
-
-        # Convert to full S3 URIs
-        zarr_uris = [f"s3://{path}" for path in zarr_stores]
-
-        logger.info(f"Loading validated model: {model_name}")
-        _ds = xr.open_mfdataset(
-            zarr_uris,
-            engine="zarr",
-            combine="by_coords",
-            parallel=True,
-            preprocess=decade_month_calc,
+    with cf.ThreadPoolExecutor(max_workers=MODEL_LOAD_WORKERS) as executor:
+        models = executor.map(
+            lambda model_path: load_model(
+                fs=fs,
+                model_path=model_path,
+                ssp=ssp,
+                climate_variable=climate_variable,
+                bbox=bbox,
+            ),
+            model_paths,
         )
-        _da = _ds[climate_variable]
-        _da = _da.assign_coords({constants.X_DIM: (((_da[constants.X_DIM] + 180) % 360) - 180)})
-        _da = _da.sortby(constants.X_DIM)
+        data = [_da for _da in models if _da is not None]
 
-        # Bbox currently only in -180-180 lon
-        # TODO: Add better error and case handling
-        if bbox:
-            _da = _da.sel(
-                {
-                    constants.Y_DIM: slice(bbox["min_lat"], bbox["max_lat"]),
-                    constants.X_DIM: slice(bbox["min_lon"], bbox["max_lon"]),
-                },
-            )
-        _da = _da.assign_coords(model=model_name)
-        _da = _da.expand_dims("model")
-        data.append(_da)
-
-        logger.info(f"{model_name} loaded")
-    
     da = xr.combine_nested(data, concat_dim=["model"])
     da = da.assign_attrs(ensemble_members=da.model.values)
 
@@ -1,6 +1,10 @@
 import argparse
+import concurrent.futures as cf
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import sys
 
 import pipeline
 import constants
@@ -28,11 +32,27 @@ def setup_args():
     return parser.parse_args()
 
 
-if __name__ == "__main__":
-    args = setup_args()
-    
-    for ssp in [str(ssp) for ssp in constants.SSPS]:
-        logger.info(f"STARTING PIPELINE FOR SSP {ssp}")
+def init_worker_logging(log_queue: multiprocessing.Queue) -> None:
+    """Sends a worker's log records to the parent process through a queue
+
+    Importing pipeline modules in the worker installs a stderr handler via
+    basicConfig; it is replaced so only the parent's listener writes to stderr.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+
+def run_ssp(ssp: str, args: argparse.Namespace, max_workers: int) -> bool:
+    """Runs the pipeline for a single SSP, logging rather than raising failures
+    so one scenario does not take down the others
+
+    Returns whether the SSP succeeded.
+    """
+    logger.info("STARTING PIPELINE FOR SSP %s", ssp)
+    try:
         pipeline.main(
             ssp=ssp,
             s3_bucket=args.s3_bucket,
@@ -44,5 +64,53 @@ if __name__ == "__main__":
             state_bbox=args.state_bbox,
             osm_category=args.osm_category,
             osm_type=args.osm_type,
+            max_workers=max_workers,
         )
-        logger.info(f"PIPELINE SUCCEEDED FOR SSP {ssp}")
+    except Exception:
+        logger.exception("PIPELINE FAILED FOR SSP %s", ssp)
+        return False
+    logger.info("PIPELINE SUCCEEDED FOR SSP %s", ssp)
+    return True
+
+
+if __name__ == "__main__":
+    args = setup_args()
+    ssps = [str(ssp) for ssp in constants.SSPS]
+
+    # SSPs are independent, so each runs in its own process. Spawned (not forked)
+    # workers start clean instead of inheriting dask state, and the executor's
+    # workers are not daemonic, so the pipeline can still start its own pools.
+    mp_context = multiprocessing.get_context("spawn")
+
+    # Workers log through a queue; a single listener thread in this process
+    # owns the stderr handler, so workers never contend on it
+    log_queue = mp_context.Queue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+
+    # Each SSP process starts its own zonal pool and dask scheduler, so the CPUs
+    # are split between them rather than each sizing for the whole machine
+    n_ssp_procs = min(len(ssps), os.cpu_count())
+    workers_per_ssp = max(os.cpu_count() // n_ssp_procs, 1)
+    try:
+        with cf.ProcessPoolExecutor(
+            max_workers=n_ssp_procs,
+            mp_context=mp_context,
+            initializer=init_worker_logging,
+            initargs=(log_queue,),
+        ) as executor:
+            succeeded = list(
+                executor.map(
+                    run_ssp, ssps, [args] * len(ssps), [workers_per_ssp] * len(ssps)
+                )
+            )
+    finally:
+        listener.stop()
+
+    # Every SSP gets its run, but the job still fails if any of them did
+    failed = [ssp for ssp, ok in zip(ssps, succeeded) if not ok]
+    if failed:
+        logger.error("PIPELINE FAILED FOR SSPS %s", ", ".join(failed))
+        sys.exit(1)
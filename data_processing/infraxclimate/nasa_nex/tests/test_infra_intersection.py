@@ -1,3 +1,5 @@
+import os
+
 import pytest
 import xarray as xr
 import numpy as np
@@ -13,6 +15,10 @@ from pandas.testing import assert_frame_equal
 from ..infra_intersection import (
     zonal_aggregation,
     create_pgosm_flex_query,
+    chunk_by_vertex_count,
+    load_infra,
+    infra_cache_dir,
+    evict_infra_cache,
     ID_COLUMN,
     GEOMETRY_COLUMN,
 )
@@ -36,6 +42,14 @@ def test_create_pgosm_flex_query():
         assert table in str(query)
 
 
+def test_create_pgosm_flex_query_sample_size():
+    osm_tables = ["infrastructure_point", "infrastructure_polygon"]
+    query, params = create_pgosm_flex_query(osm_tables, "power", "4326", sample_size=100)
+
+    assert params == (4326, "power", 4326, "power", 100)
+    assert "ORDER BY random() LIMIT %s" in str(query)
+
+
 @pytest.fixture
 def sample_climate_data():
     # Create a sample climate DataArray
@@ -94,10 +108,12 @@ def test_zonal_aggregation_max(sample_climate_data, sample_infra_data):
             "value_max": [200.0, 17.0, 4000.0, 3000.0],
             "value_q1": [200.0, 17.0, 4000.0, 10.0],
             "value_q3": [200.0, 17.0, 4000.0, 3000.0],
-            "decade": [2020, 2020, 2020, 2020],
-            "month": [1, 1, 1, 1],
+            "decade": np.array([2020, 2020, 2020, 2020], dtype=np.int16),
+            "month": np.array([1, 1, 1, 1], dtype=np.int8),
         }
     )
+    value_columns = [c for c in expected_df.columns if c.startswith("value_")]
+    expected_df[value_columns] = expected_df[value_columns].astype(np.float32)
 
     # Call the function
     df = zonal_aggregation(
@@ -123,10 +139,12 @@ def test_zonal_aggregation_mean(sample_climate_data, sample_infra_data):
             "value_max": [200.0, 17.0, 1755.25, 3000.0],
             "value_q1": [200.0, 17.0, 1755.25, 10.0],
             "value_q3": [200.0, 17.0, 1755.25, 3000.0],
-            "decade": [2020, 2020, 2020, 2020],
-            "month": [1, 1, 1, 1],
+            "decade": np.array([2020, 2020, 2020, 2020], dtype=np.int16),
+            "month": np.array([1, 1, 1, 1], dtype=np.int8),
         }
     )
+    value_columns = [c for c in expected_df.columns if c.startswith("value_")]
+    expected_df[value_columns] = expected_df[value_columns].astype(np.float32)
 
     # Call the function
     df = zonal_aggregation(
@@ -139,3 +157,106 @@ def test_zonal_aggregation_mean(sample_climate_data, sample_infra_data):
 
     # Check that the DataFrame contains expected data
     assert_frame_equal(df.sort_values(by="osm_id").reset_index(drop=True), expected_df)
+
+
+def test_zonal_aggregation_points_only(sample_climate_data, sample_infra_data):
+
+    point_infra = sample_infra_data.loc[sample_infra_data.geom_type == "Point"]
+
+    # Empty line and polygon subsets should be skipped rather than sent to xvec
+    df = zonal_aggregation(
+        climate=sample_climate_data,
+        infra=point_infra,
+        zonal_agg_method="mean",
+        x_dim="x",
+        y_dim="y",
+    )
+
+    assert df.sort_values(by="osm_id")["osm_id"].tolist() == [1, 2]
+    assert df["value_mean"].dtype == np.float32
+
+
+def test_chunk_by_vertex_count():
+    big = Point(0, 0).buffer(2)
+    small = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)])
+    geometry = gpd.GeoSeries(
+        [big, small, small, small], index=pd.Index([1, 2, 3, 4], name=ID_COLUMN)
+    )
+
+    chunks = chunk_by_vertex_count(geometry, 2)
+
+    # The large polygon gets a chunk to itself, the small ones share the other
+    assert sorted(chunk.index.tolist() for chunk in chunks) == [[1], [2, 3, 4]]
+
+
+def test_load_infra_cache(sample_infra_data, tmp_path):
+    conn = MagicMock()
+    module = load_infra.__module__
+    with patch(f"{module}.INFRA_CACHE_DIR", tmp_path / "cache"), patch(
+        f"{module}.get_osm_tables", return_value=["infrastructure_point"]
+    ), patch(
+        f"{module}.get_osm_snapshot", return_value="2025-01-22 00:00:00|state"
+    ) as mock_snapshot, patch(
+        f"{module}.query_infra", return_value=sample_infra_data
+    ) as mock_query:
+        first = load_infra("infrastructure", "power", "4326", conn)
+        second = load_infra("infrastructure", "power", "4326", conn)
+
+        # Second call is served from the cache file
+        assert mock_query.call_count == 1
+        assert second.equals(first)
+        assert second.crs == first.crs
+        assert (tmp_path / "cache").stat().st_mode & 0o777 == 0o700
+
+        # A changed relation, e.g. a refreshed view, misses the cache
+        mock_snapshot.return_value = "2025-01-22 00:00:00|refreshed"
+        load_infra("infrastructure", "power", "4326", conn)
+        assert mock_query.call_count == 2
+
+        # Without a recorded import nothing is read from or written to the cache
+        mock_snapshot.return_value = None
+        load_infra("infrastructure", "power", "4326", conn)
+        load_infra("infrastructure", "power", "4326", conn)
+        assert mock_query.call_count == 4
+        assert len(list((tmp_path / "cache").iterdir())) == 2
+
+
+def test_infra_cache_dir_refuses_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with patch(f"{load_infra.__module__}.INFRA_CACHE_DIR", shared):
+        assert infra_cache_dir() is None
+
+
+def test_evict_infra_cache(tmp_path):
+    old, new = tmp_path / "old.npz", tmp_path / "new.npz"
+    old.touch()
+    new.touch()
+    os.utime(old, (0, 0))
+
+    evict_infra_cache(tmp_path)
+
+    assert not old.exists()
+    assert new.exists()
+
+
+def test_zonal_aggregation_outside_extent(sample_climate_data, sample_infra_data):
+
+    outside = gpd.GeoDataFrame(
+        {GEOMETRY_COLUMN: [Polygon([(10, 10), (10, 11), (11, 11), (11, 10)])]},
+        index=pd.Index([5], name=ID_COLUMN),
+        geometry=GEOMETRY_COLUMN,
+        crs="EPSG:4326",
+    )
+    infra = pd.concat([sample_infra_data, outside])
+
+    df = zonal_aggregation(
+        climate=sample_climate_data,
+        infra=infra,
+        zonal_agg_method="mean",
+        x_dim="x",
+        y_dim="y",
+    )
+
+    assert sorted(df["osm_id"].unique()) == [1, 2, 3, 4]
@@ -9,6 +9,8 @@ from ..process_climate import (
     validate_model_ssp,
     validate_model_years,
     decade_month_calc,
+    preprocess_store,
+    convert_lon,
     reduce_model_stats,
     load_data,
     main,
@@ -102,15 +104,16 @@ def test_validate_model_years(zarr_stores, expected):
 # ------------------------------------------------------------------------------
 # decade_month_calc
 # ------------------------------------------------------------------------------
-def test_decade_month_calc():
+@pytest.fixture(scope="module")
+def synthetic_monthly_ds():
     """
-    Test that decade_month_calc groups correctly by decade and month.
-    We'll create a small synthetic dataset with time dimension spanning 1950-1959 monthly.
-    That is 120 months. The code lumps them by decade (1950) + month => 12 unique groups.
+    Small synthetic dataset with a monthly time dimension spanning 1950-1959.
+    Built once per module from a seeded generator so results are deterministic.
     """
     time = xr.cftime_range(start="1950-01-01", end="1959-12-01", freq="MS", calendar="gregorian")
-    data = np.random.rand(len(time), 2, 2)  # shape=(120, 2, 2)
-    ds = xr.Dataset(
+    rng = np.random.default_rng(0)
+    data = rng.random((len(time), 2, 2))  # shape=(120, 2, 2)
+    return xr.Dataset(
         {
             "temp": (["time", "lat", "lon"], data),
         },
@@ -121,8 +124,15 @@ def test_decade_month_calc():
         },
     )
 
+
+def test_decade_month_calc(synthetic_monthly_ds):
+    """
+    Test that decade_month_calc groups correctly by decade and month.
+    The synthetic dataset spans 1950-1959 monthly.
+    That is 120 months. The code lumps them by decade (1950) + month => 12 unique groups.
+    """
     # Apply the decade_month_calc
-    result = decade_month_calc(ds, time_dim="time")
+    result = decade_month_calc(synthetic_monthly_ds, time_dim="time")
 
     # Because 1950 through 1959 is still the "1950s" => decade=1950
     # We get 12 unique decade-month combos, one per month of the year
@@ -130,6 +140,58 @@ def test_decade_month_calc():
     assert "decade_month" in result.coords
     # The number of unique groups is 12:
     assert len(result["decade_month"]) == 12
+    assert result["decade_month"].values[0] == "1950-01"
+    assert result["decade_month"].values[-1] == "1950-12"
+
+
+def test_decade_month_calc_labels_span_decades():
+    """
+    Labels are formatted once per group; check they stay paired with the right
+    decade and zero-padded month across a decade boundary.
+    """
+    time = xr.cftime_range(start="1958-11-01", end="1961-02-01", freq="MS", calendar="noleap")
+    ds = xr.Dataset(
+        {"temp": (["time"], np.arange(len(time), dtype=float))},
+        coords={"time": time},
+    )
+    result = decade_month_calc(ds, time_dim="time")
+
+    assert len(result["decade_month"]) == 24
+    assert result["decade_month"].values[0] == "1950-01"
+    assert result["decade_month"].values[-1] == "1960-12"
+    # January of the 1960s averages Jan 1960 (index 14) and Jan 1961 (index 26)
+    assert result["temp"].sel(decade_month="1960-01").item() == 20.0
+
+
+@pytest.mark.parametrize(
+    "lon, expected_lon",
+    [
+        ([0.0, 90.0, 180.0, 270.0], [-180.0, -90.0, 0.0, 90.0]),
+        ([-90.0, 0.0, 90.0], [-90.0, 0.0, 90.0]),
+    ],
+)
+def test_convert_lon(lon, expected_lon):
+    ds = xr.Dataset(
+        {"temp": (["lon"], np.array(lon))},
+        coords={"lon": lon},
+    )
+    result = convert_lon(ds)
+
+    assert result["lon"].values.tolist() == expected_lon
+    # Each value (its original longitude) stays attached to the same meridian
+    assert ((result["temp"] - result["lon"]) % 360 == 0).all()
+
+
+def test_preprocess_store_bbox(synthetic_monthly_ds):
+    """
+    The store is clipped to the bbox before the decade-month mean is taken.
+    """
+    bbox = {"min_lon": 10.5, "min_lat": 0, "max_lon": 12, "max_lat": 0}
+    result = preprocess_store(synthetic_monthly_ds, bbox=bbox)
+
+    assert result["lon"].values.tolist() == [11]
+    assert result["lat"].values.tolist() == [0]
+    assert len(result["decade_month"]) == 12
 
 
 # ------------------------------------------------------------------------------
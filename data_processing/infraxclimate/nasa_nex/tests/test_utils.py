@@ -0,0 +1,65 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+
+from ..utils import (
+    DataFrameBinaryStream,
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    get_osm_category_tables,
+    round_significant,
+)
+
+
+@pytest.mark.parametrize("size", [-1, 1, 7, 4096])
+def test_dataframe_binary_stream(size):
+    df = pd.DataFrame(
+        {
+            "osm_id": np.array([7], dtype=np.int64),
+            "month": np.array([1], dtype=np.int8),
+            "value_mean": np.array([0.5], dtype=np.float32),
+        }
+    )
+    stream = DataFrameBinaryStream([df, df.iloc[:0]], columns=["osm_id", "month", "value_mean"])
+
+    parts = []
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        parts.append(data)
+
+    # Field count, then a (length, value) pair per column. int8 is widened to SMALLINT.
+    row = (
+        struct.pack(">h", 3)
+        + struct.pack(">iq", 8, 7)
+        + struct.pack(">ih", 2, 1)
+        + struct.pack(">if", 4, 0.5)
+    )
+    assert b"".join(parts) == PGCOPY_HEADER + row + PGCOPY_TRAILER
+
+
+def test_round_significant():
+    rng = np.random.default_rng(0)
+    values = (rng.standard_normal(10000) * 10.0 ** rng.integers(-8, 9, 10000)).astype(np.float32)
+    values = np.concatenate([values, np.float32([0.0, 0.3, 100005.0, 99999.5, -1e-3])])
+
+    rounded = round_significant(values, 5)
+
+    assert rounded.dtype == np.float64
+    assert rounded.tolist() == [float("%.5g" % value) for value in values]
+
+
+def test_get_osm_category_tables():
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = [("land_use_point",), ("land_use_polygon",)]
+
+    tables = get_osm_category_tables("land_use", conn)
+
+    assert tables == ["land_use_point", "land_use_polygon"]
+    # The underscore is escaped so LIKE does not treat it as a wildcard
+    assert cur.execute.call_args.args[1] == ("land\\_use%",)
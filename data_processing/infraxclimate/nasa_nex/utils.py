@@ -1,9 +1,12 @@
+import concurrent.futures as cf
 import io
-import re
+import os
+import struct
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
 import boto3
+from botocore.config import Config
 import numpy as np
 import pandas as pd
 import psycopg2 as pg
@@ -12,6 +15,8 @@ import xarray as xr
 
 import constants
 
+_S3_CLIENT = None
+
 def str_to_bool(s):
     return s.lower() in ['true', '1', 't', 'y', 'yes']
 
@@ -74,43 +79,108 @@ def create_s3_prefix(
     return str(s3_prefix)
 
 
-def download_files(s3_bucket: str, s3_prefix: str, dir: str) -> None:
+def get_s3_client():
+    """Returns a module-level S3 client, created on first use
+
+    Creating a client resolves credentials and loads the service model, so one
+    is shared by all transfers. boto3 clients are thread-safe, and the connection
+    pool is sized for the concurrent transfers in download_files/upload_files.
+    """
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT = boto3.client(
+            "s3",
+            config=Config(
+                max_pool_connections=32,
+                retries={"max_attempts": 10, "mode": "adaptive"},
+            ),
+        )
+    return _S3_CLIENT
+
+
+def download_files(s3_bucket: str, s3_prefix: str, dir: str, max_workers: int = 16) -> None:
     """Downloads all files in a give prefix to the directory
 
+    Files are downloaded concurrently on a thread pool. Keys ending in "/" are
+    folder markers and are skipped.
+
     Args:
         s3_bucket (str): AWS S3 Bucket
         s3_base_prefix (str): AWS S3 Prefix (should contain 1 or more files)
         climate_variable (str): Name of climate variable to download
         ssp (str): Scenario to download
         dir (str): Directory to save files to
+        max_workers (int): Number of concurrent downloads
     """
-    client = boto3.client("s3")
-    response = client.list_objects_v2(Bucket=s3_bucket, Prefix=s3_prefix)
-    contents = response["Contents"][1:]
-
-    for file in contents:
-        prefix = file["Key"]
-        download_file = (Path(dir) / prefix).name
-        download_path = Path(dir) / download_file
-        client.download_file(s3_bucket, prefix, str(download_path))
-
-
-def upload_files(s3_bucket: str, s3_prefix: str, dir: str) -> None:
+    client = get_s3_client()
+
+    # list_objects_v2 returns at most 1000 keys per call
+    paginator = client.get_paginator("list_objects_v2")
+    keys = [
+        file["Key"]
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix)
+        for file in page.get("Contents", [])
+        if not file["Key"].endswith("/")
+    ]
+
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                client.download_file, s3_bucket, key, str(Path(dir) / Path(key).name)
+            )
+            for key in keys
+        ]
+        for future in cf.as_completed(futures):
+            future.result()
+
+
+def upload_files(s3_bucket: str, s3_prefix: str, dir: str, max_workers: int = 16) -> None:
     """Uploads all files in the specified directory to the given S3 bucket and prefix
 
+    Files are uploaded concurrently on a thread pool.
+
     Args:
         s3_bucket (str): AWS S3 Bucket
         s3_prefix (str): AWS S3 Prefix to upload the files to
         dir (str): Path to the directory containing files to upload
+        max_workers (int): Number of concurrent uploads
     """
-    client = boto3.client("s3")
-    directory = Path(dir)
+    client = get_s3_client()
+
+    # scandir entries carry the file type from the directory listing, so
+    # is_file() does not need a stat call per file
+    with os.scandir(dir) as entries:
+        files = [(entry.path, entry.name) for entry in entries if entry.is_file()]
 
-    for file_path in directory.iterdir():
-        if file_path.is_file():
-            file_name = file_path.name
-            s3_key = str(Path(s3_prefix) / file_name)
-            client.upload_file(str(file_path), s3_bucket, s3_key)
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                client.upload_file, path, s3_bucket, f"{s3_prefix.rstrip('/')}/{name}"
+            )
+            for path, name in files
+        ]
+        for future in cf.as_completed(futures):
+            future.result()
+
+
+def round_significant(values: np.ndarray, digits: int) -> np.ndarray:
+    """Rounds values to the given number of significant digits, as float64
+
+    Gives the same numbers as formatting with "%.{digits}g" and parsing the
+    text back, without going through strings.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.copy()
+    nonzero = np.isfinite(values) & (values != 0)
+    v = values[nonzero]
+    exponent = digits - 1 - np.floor(np.log10(np.abs(v))).astype(np.int64)
+    # Powers of ten up to 1e22 are exact, so scaling by division or
+    # multiplication rounds once, like parsing the decimal text would
+    scale = 10.0 ** np.abs(exponent)
+    rounded[nonzero] = np.where(
+        exponent >= 0, np.round(v * scale) / scale, np.round(v / scale) * scale
+    )
+    return rounded
 
 
 def query_db(query: sql.SQL, conn: pg.extensions.connection, params: Tuple[str] = None):
@@ -121,15 +191,127 @@ def query_db(query: sql.SQL, conn: pg.extensions.connection, params: Tuple[str]
     return result
 
 
-def copy_df_db(query: sql.SQL, df: pd.DataFrame, conn: pg.extensions.connection):
-    """Reads pandas dataframe and copies directly to table in query"""
+class _ChunkedStream(io.IOBase):
+    """Read-only file object over a generator of str or bytes chunks.
+
+    psycopg2's copy_expert() pulls from the file in small blocks, so only one
+    chunk is held in memory at a time instead of the whole table.
+    """
 
-    sio = io.StringIO()
-    sio.write(df.to_csv(index=False, header=False))
-    sio.seek(0)
+    def __init__(self, chunks, empty):
+        self._chunks = chunks
+        self._empty = empty
+        self._buffer = empty
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1):
+        parts = []
+        while size != 0:
+            if self._pos >= len(self._buffer):
+                self._buffer = next(self._chunks, self._empty)
+                self._pos = 0
+                if not self._buffer:
+                    break
+            end = len(self._buffer) if size < 0 else min(len(self._buffer), self._pos + size)
+            parts.append(self._buffer[self._pos : end])
+            if size > 0:
+                size -= end - self._pos
+            self._pos = end
+        return self._empty.join(parts)
+
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+
+def pg_binary_dtype(dtype: np.dtype) -> np.dtype:
+    """Returns the big-endian dtype PostgreSQL binary COPY expects for a column.
+
+    Integers map to SMALLINT, INTEGER or BIGINT by size (PostgreSQL has no one
+    byte integer, so int8 is widened to SMALLINT), float32 to REAL, float64 to
+    DOUBLE PRECISION and bool to BOOLEAN. The target table columns must have
+    exactly these types, binary COPY does not cast.
+    """
+    if dtype.kind in "iu":
+        size = dtype.itemsize * (2 if dtype.kind == "u" else 1)
+        return np.dtype(">i2" if size <= 2 else ">i4" if size <= 4 else ">i8")
+    if dtype.kind == "f":
+        return np.dtype(">f4" if dtype.itemsize <= 4 else ">f8")
+    if dtype.kind == "b":
+        return np.dtype("?")
+    raise TypeError(f"Column dtype {dtype} is not supported by binary COPY")
+
+
+def encode_pg_binary(df: pd.DataFrame) -> bytes:
+    """Encodes DataFrame rows as PostgreSQL binary COPY tuples.
+
+    Every row is a field count followed by a (length, value) pair per column.
+    All columns are fixed width, so the rows are laid out as one packed numpy
+    record array and written with a single tobytes() call. Missing values are
+    not encoded as NULL, so the frame should not contain any.
+    """
+    pg_dtypes = [pg_binary_dtype(dtype) for dtype in df.dtypes]
+    fields = [("count", ">i2")]
+    for i, pg_dtype in enumerate(pg_dtypes):
+        fields += [(f"length_{i}", ">i4"), (f"value_{i}", pg_dtype)]
+
+    rows = np.empty(len(df), dtype=np.dtype(fields))
+    rows["count"] = len(pg_dtypes)
+    for i, (column, pg_dtype) in enumerate(zip(df.columns, pg_dtypes)):
+        rows[f"length_{i}"] = pg_dtype.itemsize
+        rows[f"value_{i}"] = df[column].to_numpy()
+    return rows.tobytes()
+
+
+class DataFrameBinaryStream(_ChunkedStream):
+    """Read-only file object that renders DataFrames in PostgreSQL binary COPY
+    format while it is read.
+
+    Used with COPY ... FROM STDIN WITH (FORMAT binary). Numbers go over the wire
+    as fixed width big-endian values, so neither side formats or parses text.
+    See pg_binary_dtype() for the column types the target table must use.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame | List[pd.DataFrame],
+        chunksize: int = 50000,
+        columns: List[str] = None,
+    ):
+        frames = [df] if isinstance(df, pd.DataFrame) else df
+
+        def chunks():
+            yield PGCOPY_HEADER
+            for frame in frames:
+                for start in range(0, len(frame), chunksize):
+                    chunk = frame.iloc[start : start + chunksize]
+                    yield encode_pg_binary(chunk if columns is None else chunk[columns])
+            yield PGCOPY_TRAILER
+
+        super().__init__(chunks(), b"")
+
+
+def copy_df_db(
+    query: sql.SQL,
+    df: pd.DataFrame | List[pd.DataFrame],
+    conn: pg.extensions.connection,
+    columns: List[str] = None,
+):
+    """Reads pandas dataframe and copies directly to table in query
+
+    Rows are sent in PostgreSQL's binary format, so:
+    - The query must be a COPY ... FROM STDIN WITH (FORMAT binary) statement.
+    - Each column's dtype must match its table column type exactly, see
+      pg_binary_dtype(). Binary COPY does not cast, e.g. float32 needs a REAL
+      column and float64 a DOUBLE PRECISION one.
+    - Columns may not contain missing values.
+    """
 
     with conn.cursor() as cur:
-        cur.copy_expert(query, sio)
+        cur.copy_expert(query, DataFrameBinaryStream(df, columns=columns))
 
 
 def get_osm_category_tables(
@@ -141,23 +323,40 @@ def get_osm_category_tables(
     This assumes you are querying a database set up with PG OSM Flex
     """
 
-    query = sql.SQL("SELECT tablename FROM pg_tables WHERE schemaname='osm'")
+    # Table name always starts with category. The prefix match runs in Postgres,
+    # with LIKE wildcards in the category escaped so it is matched literally.
+    query = sql.SQL(
+        "SELECT tablename FROM pg_tables WHERE schemaname='osm' AND tablename LIKE %s"
+    )
+    prefix = (
+        osm_category.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
 
-    all_tables = query_db(query=query, conn=conn, params=None)
+    matching_tables = query_db(query=query, conn=conn, params=(prefix + "%",))
 
-    # Table name always starts with category
-    tables = []
-    for table in all_tables:
-        tablename = table[0]
-        name_match = re.findall(osm_category, tablename)
-        if name_match:
-            tables.append(tablename)
+    tables = [table[0] for table in matching_tables]
 
     return tables
 
 
+# Exact type -> converter for the attribute types seen in climate metadata
+_CONVERTERS = {
+    np.int64: int,
+    np.int32: int,
+    np.float64: float,
+    np.float32: float,
+    np.ndarray: np.ndarray.tolist,
+    bytes: lambda b: b.decode("utf-8"),
+}
+
+
 def convert_to_serializable(value: Any) -> Any:
     """Converts a value to a JSON serializable type."""
+    converter = _CONVERTERS.get(type(value))
+    if converter is not None:
+        return converter(value)
+
+    # Other numpy scalar widths and subclasses
     if isinstance(value, (np.integer)):
         return int(value)
     elif isinstance(value, (np.floating)):
@@ -5,6 +5,9 @@ CREATE DATABASE washington;
 
 CREATE EXTENSION postgis;
 
+-- GiST operator classes for scalar columns, for composite (osm_type, geom) indexes
+CREATE EXTENSION btree_gist;
+
 CREATE ROLE pgosm_flex WITH LOGIN PASSWORD 'mysecretpassword';
 
 CREATE SCHEMA osm;
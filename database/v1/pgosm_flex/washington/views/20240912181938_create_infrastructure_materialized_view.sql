@@ -9,6 +9,7 @@ SELECT
     i.osm_subtype,
     ST_GeometryType(i.geom) AS geom_type,
     i.geom,
+    ST_Envelope(i.geom) AS bbox,
     t.tags
 FROM osm.infrastructure_point i
 JOIN osm.tags t ON i.osm_id = t.osm_id
@@ -19,6 +20,7 @@ SELECT
     i.osm_subtype,
     ST_GeometryType(i.geom) AS geom_type,
     i.geom,
+    ST_Envelope(i.geom) AS bbox,
     t.tags
 FROM osm.infrastructure_line i
 JOIN osm.tags t ON i.osm_id = t.osm_id
@@ -29,16 +31,21 @@ SELECT
     i.osm_subtype,
     ST_GeometryType(i.geom) AS geom_type,
     i.geom,
+    ST_Envelope(i.geom) AS bbox,
     t.tags
 FROM osm.infrastructure_polygon i
 JOIN osm.tags t ON i.osm_id = t.osm_id;
 
 CREATE INDEX infrastructure_idx_osm_id ON osm.infrastructure (osm_id);
 CREATE INDEX infrastructure_idx_geom ON osm.infrastructure USING GIST (geom);
+-- Bounding box only (&&) API queries check this instead of the full geometry
+CREATE INDEX infrastructure_idx_bbox ON osm.infrastructure USING GIST (bbox);
 CREATE INDEX infrastructure_idx_osm_type ON osm.infrastructure (osm_type);
 CREATE INDEX infrastructure_idx_osm_subtype ON osm.infrastructure (osm_subtype);
 CREATE INDEX infrastructure_idx_osm_type_subtype ON osm.infrastructure (osm_type, osm_subtype);
 CREATE INDEX infrastructure_idx_geom_type ON osm.infrastructure (geom_type);
+-- Type and bbox filters of API queries in one GiST scan (needs btree_gist)
+CREATE INDEX infrastructure_idx_osm_type_subtype_geom ON osm.infrastructure USING GIST (osm_type, osm_subtype, geom);
 
 -- Grant SELECT on the materialized view to osm_ro_user and climate_user
 GRANT SELECT ON osm.infrastructure TO osm_ro_user;
@@ -10,6 +10,7 @@ SELECT
     a.name,
     ST_GeometryType(a.geom) AS geom_type,
     a.geom,
+    ST_Envelope(a.geom) AS bbox,
     t.tags
 FROM osm.amenity_point a
 JOIN osm.tags t ON a.osm_id = t.osm_id
@@ -21,6 +22,7 @@ SELECT
     a.name,
     ST_GeometryType(a.geom) AS geom_type,
     a.geom,
+    ST_Envelope(a.geom) AS bbox,
     t.tags
 FROM osm.amenity_line a
 JOIN osm.tags t ON a.osm_id = t.osm_id
@@ -32,13 +34,18 @@ SELECT
     a.name,
     ST_GeometryType(a.geom) AS geom_type,
     a.geom,
+    ST_Envelope(a.geom) AS bbox,
     t.tags
 FROM osm.amenity_polygon a
 JOIN osm.tags t ON a.osm_id = t.osm_id;
 
 CREATE INDEX amenity_idx_osm_id ON osm.amenity (osm_id);
 CREATE INDEX amenity_idx_geom ON osm.amenity USING GIST (geom);
+-- Bounding box only (&&) API queries check this instead of the full geometry
+CREATE INDEX amenity_idx_bbox ON osm.amenity USING GIST (bbox);
 CREATE INDEX amenity_idx_osm_type ON osm.amenity (osm_type);
 CREATE INDEX amenity_idx_osm_subtype ON osm.amenity (osm_subtype);
 CREATE INDEX amenity_idx_osm_type_subtype ON osm.amenity (osm_type, osm_subtype);
-CREATE INDEX amenity_idx_geom_type ON osm.amenity (geom_type);
\ No newline at end of file
+CREATE INDEX amenity_idx_geom_type ON osm.amenity (geom_type);
+-- Type and bbox filters of API queries in one GiST scan (needs btree_gist)
+CREATE INDEX amenity_idx_osm_type_subtype_geom ON osm.amenity USING GIST (osm_type, osm_subtype, geom);
\ No newline at end of file
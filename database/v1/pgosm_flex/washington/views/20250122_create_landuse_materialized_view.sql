@@ -9,6 +9,7 @@ SELECT
     lpoint.name,
     ST_GeometryType(lpoint.geom) AS geom_type,
     lpoint.geom,
+    ST_Envelope(lpoint.geom) AS bbox,
     tpoint.tags
 FROM osm.landuse_point lpoint
 JOIN osm.tags tpoint ON lpoint.osm_id = tpoint.osm_id
@@ -19,14 +20,19 @@ SELECT
     lpolygon.name,
     ST_GeometryType(lpolygon.geom) AS geom_type,
     lpolygon.geom,
+    ST_Envelope(lpolygon.geom) AS bbox,
     tpolygon.tags
 FROM osm.landuse_polygon lpolygon
 JOIN osm.tags tpolygon ON lpolygon.osm_id = tpolygon.osm_id;
 
 CREATE INDEX landuse_idx_osm_id ON osm.landuse (osm_id);
 CREATE INDEX landuse_idx_geom ON osm.landuse USING GIST (geom);
+-- Bounding box only (&&) API queries check this instead of the full geometry
+CREATE INDEX landuse_idx_bbox ON osm.landuse USING GIST (bbox);
 CREATE INDEX landuse_idx_osm_type ON osm.landuse (osm_type);
 CREATE INDEX landuse_idx_geom_type ON osm.landuse (geom_type);
+-- Type and bbox filters of API queries in one GiST scan (needs btree_gist)
+CREATE INDEX landuse_idx_osm_type_geom ON osm.landuse USING GIST (osm_type, geom);
 
 -- Grant SELECT on the materialized view to osm_ro_user and climate_user
 GRANT SELECT ON osm.landuse TO osm_ro_user;
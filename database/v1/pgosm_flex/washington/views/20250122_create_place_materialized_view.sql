@@ -11,6 +11,7 @@ SELECT
     p.name,
     ST_GeometryType(p.geom) AS geom_type,
     p.geom,
+    ST_Envelope(p.geom) AS bbox,
     t.tags
 FROM osm.place_point p
 JOIN osm.tags t ON p.osm_id = t.osm_id
@@ -23,6 +24,7 @@ SELECT
     p.name,
     ST_GeometryType(p.geom) AS geom_type,
     p.geom,
+    ST_Envelope(p.geom) AS bbox,
     t.tags
 FROM osm.place_line p
 JOIN osm.tags t ON p.osm_id = t.osm_id
@@ -35,16 +37,21 @@ SELECT
     p.name,
     ST_GeometryType(p.geom) AS geom_type,
     p.geom,
+    ST_Envelope(p.geom) AS bbox,
     t.tags
 FROM osm.place_polygon p
 JOIN osm.tags t ON p.osm_id = t.osm_id;
 
 CREATE INDEX place_idx_osm_id ON osm.place (osm_id);
 CREATE INDEX place_idx_geom ON osm.place USING GIST (geom);
+-- Bounding box only (&&) API queries check this instead of the full geometry
+CREATE INDEX place_idx_bbox ON osm.place USING GIST (bbox);
 CREATE INDEX place_idx_osm_type ON osm.place (osm_type);
 CREATE INDEX place_idx_osm_type_boundary ON osm.place (osm_type, boundary);
 CREATE INDEX place_idx_osm_admin_level ON osm.place (admin_level);
 CREATE INDEX place_idx_geom_type ON osm.place (geom_type);
+-- Type and bbox filters of API queries in one GiST scan (needs btree_gist)
+CREATE INDEX place_idx_osm_type_geom ON osm.place USING GIST (osm_type, geom);
 
 -- Grant SELECT on the materialized view to osm_ro_user and climate_user
 GRANT SELECT ON osm.place TO osm_ro_user;